@@ -18,7 +18,8 @@ class GlobalSettings(object):
 
 # 配置识别app的后台可视化
 class ImagesPostModelAdmin(object):
-    list_display = ["user", "nation1", "nation2", "nation3", "time_consuming", "modified_nation"]  # 需要展示的数据库字段
+    list_display = ["user", "nation1", "confidence1", "nation2", "confidence2", "nation3", "confidence3",
+                    "time_consuming", "status", "modified_nation"]  # 需要展示的数据库字段
 
 
 xadmin.site.register(views.BaseAdminView, BaseSetting)  # 全局配置注册
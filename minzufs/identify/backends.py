@@ -0,0 +1,128 @@
+"""
+分类模型的推理后端。
+
+默认使用 Keras 加载训练得到的 ``.h5`` 模型；也可以通过 ``export_model`` 命令把模型导出为 ONNX 或 TFLite ，
+再设置 ``settings.IDENTIFY_INFERENCE_BACKEND`` 使用更轻量的运行时，服务进程不再需要导入完整的 TensorFlow 。
+各个后端只在创建时导入对应的依赖。
+"""
+import threading
+from pathlib import Path
+
+import numpy as np
+
+# 各个后端默认使用的模型文件
+MODEL_FILE_NAMES = {
+    'keras': 'Dense2018983.h5',
+    'onnx': 'Dense2018983.onnx',
+    'tflite': 'Dense2018983.tflite',
+}
+
+
+def normalize(batch):
+    """把 uint8 的图片转换为模型的输入，范围 [-1, 1] 。"""
+    return batch.astype(np.float32) / 127.5 - 1
+
+
+class InferenceBackend:
+    """
+    推理后端的接口
+    ``predict`` 接收形如 (N, ROWS, COLS, CHANNELS) 的 uint8 图片，返回形如 (N, 类别数) 的概率。
+    """
+    name = None
+
+    def __init__(self, model_path: Path):
+        self.model_path = Path(model_path)
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+
+class KerasBackend(InferenceBackend):
+    name = 'keras'
+
+    def __init__(self, model_path):
+        super().__init__(model_path)
+        from tensorflow.keras.models import load_model
+
+        self.model = load_model(str(self.model_path), compile=False)
+        # 提前构建 predict 函数，避免多个线程第一次预测时并发构建
+        if hasattr(self.model, 'make_predict_function'):
+            self.model.make_predict_function()
+
+    def predict(self, batch):
+        return np.asarray(self.model.predict(normalize(batch)))
+
+
+class OnnxBackend(InferenceBackend):
+    name = 'onnx'
+
+    def __init__(self, model_path):
+        super().__init__(model_path)
+        import onnxruntime
+
+        self.session = onnxruntime.InferenceSession(str(self.model_path), providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict(self, batch):
+        # InferenceSession.run 可以被多个线程同时调用
+        return self.session.run(None, {self.input_name: normalize(batch)})[0]
+
+
+class TFLiteBackend(InferenceBackend):
+    name = 'tflite'
+
+    def __init__(self, model_path):
+        super().__init__(model_path)
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+
+        self.interpreter = Interpreter(model_path=str(self.model_path))
+        self.interpreter.allocate_tensors()
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self._batch_size = int(self.input['shape'][0])
+        # Interpreter 不能被多个线程同时使用
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _quantize(x, detail):
+        scale, zero_point = detail['quantization']
+        if not scale:
+            return x.astype(detail['dtype'])
+        info = np.iinfo(detail['dtype'])
+        return np.clip(np.round(x / scale + zero_point), info.min, info.max).astype(detail['dtype'])
+
+    @staticmethod
+    def _dequantize(x, detail):
+        scale, zero_point = detail['quantization']
+        if not scale:
+            return x.astype(np.float32)
+        return (x.astype(np.float32) - zero_point) * scale
+
+    def predict(self, batch):
+        x = normalize(batch)
+        if self.input['dtype'] != np.float32:
+            # 完全 int8 量化的模型，输入输出也需要量化
+            x = self._quantize(x, self.input)
+        with self._lock:
+            if len(x) != self._batch_size:
+                self.interpreter.resize_tensor_input(self.input['index'], x.shape)
+                self.interpreter.allocate_tensors()
+                self._batch_size = len(x)
+            self.interpreter.set_tensor(self.input['index'], x)
+            self.interpreter.invoke()
+            y = self.interpreter.get_tensor(self.output['index'])
+        return self._dequantize(y, self.output)
+
+
+BACKENDS = {backend.name: backend for backend in (KerasBackend, OnnxBackend, TFLiteBackend)}
+
+
+def create_backend(name, model_path) -> InferenceBackend:
+    try:
+        backend = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f'Unknown inference backend {name!r}, choose from {", ".join(BACKENDS)}.')
+    return backend(model_path)
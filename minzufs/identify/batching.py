@@ -0,0 +1,104 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+from django.conf import settings
+
+
+class MicroBatchScheduler:
+    """
+    推理的微批处理调度器。
+
+    并发的识别请求把预处理好的图片提交进来，后台线程把在 ``max_wait`` 秒内到达的图片
+    （最多 ``max_batch_size`` 张）拼成一个批次，只做一次前向计算，再把每一行结果交还给对应的调用者。
+    """
+
+    def __init__(self, predict_fn, max_batch_size=16, max_wait=0.01):
+        """
+        :param predict_fn: 接收形如 (N, ...) 的批次，返回 N 行结果的函数
+        :param max_batch_size: 一个批次最多包含的图片数量
+        :param max_wait: 第一张图片到达后，最多等待多少秒再开始计算
+        """
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait))
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _ensure_worker(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='identify-micro-batch', daemon=True)
+                self._thread.start()
+
+    def submit(self, item) -> Future:
+        """提交一张图片，返回一个 ``Future`` ，结果为该图片对应的那一行输出。"""
+        future = Future()
+        self._ensure_worker()
+        self._queue.put((item, future))
+        return future
+
+    def submit_many(self, items):
+        return [self.submit(item) for item in items]
+
+    def predict(self, items, timeout=None):
+        """提交若干张图片并等待结果，返回与输入顺序一致的结果数组。"""
+        futures = self.submit_many(items)
+        return np.stack([future.result(timeout) for future in futures])
+
+    def _collect(self):
+        """阻塞等待第一张图片，然后在截止时间之前尽量凑满一个批次。"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            items, futures = zip(*batch)
+            # 调用者已经放弃的请求不再参与计算
+            alive = [i for i, future in enumerate(futures) if future.set_running_or_notify_cancel()]
+            if not alive:
+                continue
+            try:
+                outputs = self.predict_fn(np.stack([items[i] for i in alive]))
+                if len(outputs) != len(alive):
+                    raise ValueError(f'Expected {len(alive)} rows from the model, got {len(outputs)}.')
+                for row, i in enumerate(alive):
+                    futures[i].set_result(outputs[row])
+            except BaseException as e:
+                # 任何错误都交给还没有得到结果的调用者，工作线程继续处理后面的批次
+                for i in alive:
+                    if not futures[i].done():
+                        futures[i].set_exception(e)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler(predict_fn) -> MicroBatchScheduler:
+    """
+    获取进程内唯一的调度器，批次参数来自 ``settings.IDENTIFY_BATCH_MAX_SIZE`` 和 ``settings.IDENTIFY_BATCH_MAX_WAIT`` 。
+    """
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = MicroBatchScheduler(
+                    predict_fn,
+                    max_batch_size=getattr(settings, 'IDENTIFY_BATCH_MAX_SIZE', 16),
+                    max_wait=getattr(settings, 'IDENTIFY_BATCH_MAX_WAIT', 0.01),
+                )
+    return _scheduler
@@ -0,0 +1,80 @@
+"""
+识别、合成流程的性能测试。
+
+全部使用程序生成的图片，不依赖网络，结果输出为 JSON ，便于在不同版本之间比较。
+"""
+import io
+import json
+import platform
+import time
+
+import numpy as np
+from PIL import Image
+
+
+def summarize(samples, count=1):
+    """
+    统计耗时
+    :param samples: 每次调用的耗时（秒）
+    :param count: 每次调用处理的图片数量，用于计算吞吐量
+    :return: 毫秒为单位的分位数以及每秒处理的图片数量
+    """
+    samples = np.asarray(samples, dtype=np.float64)
+    if not len(samples):
+        return {'n': 0}
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99]) * 1000
+    return {
+        'n': int(len(samples)),
+        'mean_ms': float(samples.mean() * 1000),
+        'p50_ms': float(p50),
+        'p95_ms': float(p95),
+        'p99_ms': float(p99),
+        'images_per_sec': float(len(samples) * count / samples.sum()) if samples.sum() else None,
+    }
+
+
+def timed(fn, iterations, warmup=1):
+    """执行 ``fn`` 若干次，返回每次的耗时。"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def synthetic_image(width, height, mode='RGB', seed=0) -> np.ndarray:
+    """生成带有渐变和噪声的图片，比纯色图片更接近真实照片的压缩率。"""
+    rng = np.random.default_rng(seed)
+    channels = {'L': 1, 'RGB': 3, 'RGBA': 4}[mode]
+    y, x = np.mgrid[0:height, 0:width]
+    base = ((x / max(width - 1, 1) + y / max(height - 1, 1)) * 127).astype(np.int16)
+    noise = rng.integers(-20, 20, size=(height, width, channels), dtype=np.int16)
+    img = np.clip(base[:, :, None] + noise, 0, 255).astype(np.uint8)
+    return img[:, :, 0] if channels == 1 else img
+
+
+def encode_image(array: np.ndarray, fmt='JPEG') -> bytes:
+    buf = io.BytesIO()
+    Image.fromarray(array).save(buf, fmt, **({'quality': 90} if fmt == 'JPEG' else {}))
+    return buf.getvalue()
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': np.__version__,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def dump(result, output=None):
+    """输出 JSON 结果，``output`` 为空时返回字符串。"""
+    content = json.dumps(result, indent=2, ensure_ascii=False)
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(content)
+    return content
@@ -0,0 +1,96 @@
+"""
+人像合成到背景的性能测试：比较原来的实现、浮点数的实现和当前的定点数实现。
+
+原来的实现从磁盘读取人像和背景，把 roi 写成 JPEG 再用 PIL 读回，在 float64 下混合；
+这里保留一份副本只用于比较，写入的临时文件放在临时目录中。
+"""
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from . import summarize, synthetic_image, timed
+from ..lib.mergeimages import composite
+
+DEFAULT_BACKGROUND = (1200, 900)
+DEFAULT_FOREGROUND = (600, 900)
+
+
+def legacy_blend_images(fg_image: Path, bg_image: Path, ratio, pos, workdir: Path):
+    """原来的 ``blend_images`` ，只把 roi.jpg 的位置换成了 ``workdir`` 。"""
+    fg_image, bg_image = str(fg_image), str(bg_image)
+    fg_img = cv2.imread(fg_image)
+    bg_img = cv2.imread(bg_image)
+    height_fg, width_fg, _ = fg_img.shape
+    pos = (bg_img.shape[0] - int(ratio * height_fg), pos[1])
+    roi = bg_img[pos[0]: pos[0] + int(height_fg * ratio), pos[1]: pos[1] + int(width_fg * ratio)]
+    roi_path = str(workdir / 'roi.jpg')
+    cv2.imwrite(roi_path, roi)
+    bg_image = Image.open(roi_path).convert('RGB')
+    fg_image = Image.open(fg_image).resize(bg_image.size)
+    scope_map = np.array(fg_image)[:, :, -1] / 255
+    scope_map = scope_map[:, :, np.newaxis]
+    scope_map = np.repeat(scope_map, repeats=3, axis=2)
+    res_image = np.multiply(scope_map, np.array(fg_image)[:, :, :3]) + np.multiply((1 - scope_map),
+                                                                                   np.array(bg_image))
+    bg_img[pos[0]: pos[0] + roi.shape[0], pos[1]: pos[1] + roi.shape[1]] = np.uint8(res_image)[:, :, ::-1]
+    return bg_img
+
+
+def float_composite(fg_img: np.ndarray, roi: np.ndarray):
+    """上一个版本的 ``composite`` ，在内存中用浮点数混合。"""
+    fg = cv2.resize(fg_img, (roi.shape[1], roi.shape[0]))
+    scope_map = fg[:, :, 3:] / 255
+    roi[:] = np.uint8(scope_map * fg[:, :, :3] + (1 - scope_map) * roi)
+
+
+def synthetic_cutout(width, height) -> np.ndarray:
+    """中间是不透明的椭圆、边缘羽化的 BGRA 人像。"""
+    alpha = np.zeros((height, width), np.uint8)
+    cv2.ellipse(alpha, (width // 2, height // 2), (width // 3, height * 2 // 5), 0, 0, 360, 255, -1)
+    return np.dstack([synthetic_image(width, height, seed=1), cv2.GaussianBlur(alpha, (31, 31), 0)])
+
+
+def peak_memory(fn) -> int:
+    """执行一次 ``fn`` 时额外分配的内存峰值（字节）， numpy 的数组分配也会被统计。"""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(background=DEFAULT_BACKGROUND, foreground=DEFAULT_FOREGROUND, ratio=0.7, left=80, iterations=20):
+    bg = synthetic_image(*background)
+    fg = synthetic_cutout(*foreground)
+    height, width = int(fg.shape[0] * ratio), int(fg.shape[1] * ratio)
+    top = bg.shape[0] - height
+
+    def in_memory(fn):
+        def blend():
+            img = bg.copy()
+            fn(fg, img[top: top + height, left: left + width])
+            return img
+        return blend
+
+    with tempfile.TemporaryDirectory() as workdir:
+        workdir = Path(workdir)
+        fg_path, bg_path = workdir / 'fg.png', workdir / 'bg.png'
+        cv2.imwrite(str(fg_path), fg)
+        cv2.imwrite(str(bg_path), bg)
+        implementations = {
+            'legacy': lambda: legacy_blend_images(fg_path, bg_path, ratio, (top, left), workdir),
+            'float': in_memory(float_composite),
+            'fixed_point': in_memory(composite),
+        }
+        results = {name: {**summarize(timed(fn, iterations)), 'peak_bytes': peak_memory(fn)}
+                   for name, fn in implementations.items()}
+        reference = implementations['float']()
+        results['fixed_point']['max_diff_vs_float'] = int(np.abs(
+            implementations['fixed_point']().astype(np.int16) - reference).max())
+    return {'background': f'{background[0]}x{background[1]}', 'foreground': f'{foreground[0]}x{foreground[1]}',
+            'ratio': ratio, 'results': results}
@@ -0,0 +1,66 @@
+"""
+换脸后端的性能测试：人脸检测和换脸的耗时。
+
+``--images`` 提供真实的人物照片时，使用检测到的人脸；否则使用生成的图片和固定的人脸框，
+只能测出检测器的运行耗时，换脸部分不受影响。
+"""
+from pathlib import Path
+
+from . import encode_image, summarize, synthetic_image, timed
+from ..lib.facebackends import FACE_BACKENDS, FaceImage, get_face_backend
+
+DEFAULT_SIZE = (800, 1000)
+IMAGE_SUFFIXES = {'.jpg', '.jpeg', '.png', '.bmp', '.webp'}
+
+
+def load_images(directory=None, size=DEFAULT_SIZE):
+    """测试用的一组图片，至少两张。"""
+    if directory:
+        paths = sorted(p for p in Path(directory).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+        if len(paths) >= 2:
+            return [FaceImage(content=p.read_bytes()) for p in paths]
+    width, height = size
+    return [FaceImage(content=encode_image(synthetic_image(width, height, seed=seed))) for seed in range(2)]
+
+
+def default_face(image: FaceImage) -> dict:
+    """没有检测到人脸时使用的人脸框：图片上部居中。"""
+    height, width = image.array.shape[:2]
+    side = min(width, height) // 3
+    return {'top': height // 5, 'left': (width - side) // 2, 'width': side, 'height': side}
+
+
+def bench_backend(backend, images, iterations=10, rate=100):
+    detect_samples, faces = [], []
+    for image in images:
+        try:
+            faces.append(backend.detect(image))
+        except ValueError:
+            faces.append(None)
+        detect_samples += timed(lambda: _try_detect(backend, image), max(1, iterations // len(images)), warmup=0)
+    found = sum(face is not None for face in faces)
+    faces = [face or default_face(image) for face, image in zip(faces, images)]
+    template, extract = images[0], images[1]
+    swap = timed(lambda: backend.swap(template, faces[0], extract, faces[1], rate), iterations)
+    return {'faces_found': f'{found}/{len(images)}', 'detect': summarize(detect_samples), 'swap': summarize(swap)}
+
+
+def _try_detect(backend, image):
+    try:
+        backend.detect(image)
+    except ValueError:
+        pass
+
+
+def run(backends=tuple(FACE_BACKENDS), images_dir=None, iterations=10, size=DEFAULT_SIZE):
+    images = load_images(images_dir, size)
+    for image in images:
+        image.array  # 解码不计入耗时
+    result = {}
+    for name in backends:
+        try:
+            backend = get_face_backend(name)
+            result[name] = bench_backend(backend, images, iterations)
+        except Exception as e:
+            result[name] = {'error': f'{type(e).__name__}: {e}'}
+    return result
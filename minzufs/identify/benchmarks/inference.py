@@ -0,0 +1,76 @@
+"""
+识别流程的性能测试：图片解码、预处理和模型预测。
+"""
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from . import encode_image, summarize, synthetic_image, timed
+from ..predict import ROWS, COLS, forward, get_model, read_image
+
+DEFAULT_SIZES = ((640, 480), (1920, 1080), (4032, 3024))
+DEFAULT_FORMATS = ('JPEG', 'PNG')
+
+
+def bench_decode(sizes=DEFAULT_SIZES, formats=DEFAULT_FORMATS, iterations=10):
+    """
+    分别测试解码和预处理的耗时
+    解码：只把图片完整解码为数组；预处理：``read_image`` 的全部过程（缩小解码、旋转、缩放、通道转换）。
+    """
+    results = []
+    for width, height in sizes:
+        for fmt in formats:
+            content = encode_image(synthetic_image(width, height), fmt)
+            decode = timed(lambda: np.asarray(Image.open(io.BytesIO(content)).convert('RGB')), iterations)
+            preprocess = timed(lambda: read_image(content), iterations)
+            results.append({
+                'size': f'{width}x{height}', 'format': fmt, 'bytes': len(content),
+                'decode': summarize(decode), 'preprocess': summarize(preprocess),
+            })
+    return results
+
+
+def bench_resize(iterations=50):
+    """把已经解码的手机照片缩放到模型输入大小的耗时。"""
+    image = synthetic_image(4032, 3024)
+    return summarize(timed(lambda: cv2.resize(image, (COLS, ROWS), interpolation=cv2.INTER_CUBIC), iterations))
+
+
+def bench_inference(batch_sizes=(1, 4, 16), threads=(1, 4), iterations=20):
+    """
+    测试不同批次大小、不同并发线程数量下模型预测的延迟和吞吐量
+    每个线程各自调用 ``iterations`` 次 ``forward`` 。
+    """
+    get_model()
+    results = []
+    for batch_size in batch_sizes:
+        batch = np.stack([read_image(encode_image(synthetic_image(640, 480, seed=i))) for i in range(batch_size)])
+        forward(batch)  # 预热
+        for thread_count in threads:
+            def worker(_):
+                return timed(lambda: forward(batch), iterations, warmup=0)
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(thread_count) as executor:
+                samples = [s for samples in executor.map(worker, range(thread_count)) for s in samples]
+            elapsed = time.perf_counter() - start
+            summary = summarize(samples, batch_size)
+            # 并发时单次调用的延迟不能直接换算吞吐量，使用总耗时计算
+            summary['images_per_sec'] = len(samples) * batch_size / elapsed
+            results.append({'batch_size': batch_size, 'threads': thread_count, 'latency': summary})
+    return results
+
+
+def run(sizes=DEFAULT_SIZES, formats=DEFAULT_FORMATS, batch_sizes=(1, 4, 16), threads=(1, 4), iterations=20,
+        inference=True):
+    result = {
+        'decode': bench_decode(sizes, formats, max(1, iterations // 2)),
+        'resize': bench_resize(iterations),
+    }
+    if inference:
+        result['inference'] = bench_inference(batch_sizes, threads, iterations)
+    return result
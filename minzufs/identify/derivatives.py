@@ -0,0 +1,71 @@
+"""
+图片的衍生尺寸（缩略图等）。
+
+原图保持不变，各个尺寸在第一次访问时生成并缓存到 ``MEDIA_ROOT/derivatives`` ，
+缓存的总大小超过 ``settings.IDENTIFY_DERIVATIVE_CACHE_BYTES`` 时删除最久没有访问的文件。
+"""
+import hashlib
+import os
+from pathlib import Path
+
+from PIL import Image, ImageOps
+from django.conf import settings
+
+from .filecache import FileCache
+
+# 各个尺寸的最长边，缩放时保持宽高比
+DERIVATIVE_SIZES = {
+    'thumb': 160,
+    'list': 400,
+    'full': 1280,
+}
+DERIVATIVE_DIR = 'derivatives'
+
+
+class DerivativeCache(FileCache):
+    def __init__(self, media_root: Path, max_bytes: int):
+        super().__init__(media_root / DERIVATIVE_DIR, max_bytes)
+        self.media_root = media_root
+
+    def get(self, source: Path, size_name: str) -> str:
+        """
+        获取图片的衍生尺寸，不存在时生成
+        :param source: 原图的绝对路径
+        :param size_name: ``DERIVATIVE_SIZES`` 中的尺寸名称
+        :return: 衍生图片相对于 ``MEDIA_ROOT`` 的路径
+        """
+        if size_name not in DERIVATIVE_SIZES:
+            raise ValueError(f'Unknown derivative size {size_name!r}.')
+        stat = source.stat()
+        # 原图被替换后修改时间变化，对应新的缓存文件
+        key = hashlib.sha1(f'{source}:{stat.st_mtime_ns}:{stat.st_size}'.encode()).hexdigest()
+        relative = Path(DERIVATIVE_DIR) / size_name / key[:2] / key
+        for ext in ('.jpg', '.png'):
+            path = self.media_root / relative.with_suffix(ext)
+            if path.exists():
+                # 更新修改时间，作为淘汰时的访问时间
+                os.utime(path)
+                return str(relative.with_suffix(ext))
+
+        with Image.open(source) as img:
+            img.draft('RGB', (DERIVATIVE_SIZES[size_name],) * 2)
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((DERIVATIVE_SIZES[size_name],) * 2, Image.LANCZOS)
+            has_alpha = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+            ext, fmt = ('.png', 'PNG') if has_alpha else ('.jpg', 'JPEG')
+            img = img.convert('RGBA' if has_alpha else 'RGB')
+            self._write(self.media_root / relative.with_suffix(ext),
+                        lambda f: img.save(f, fmt, quality=85, optimize=True))
+        return str(relative.with_suffix(ext))
+
+
+derivative_cache = DerivativeCache(
+    Path(settings.MEDIA_ROOT),
+    getattr(settings, 'IDENTIFY_DERIVATIVE_CACHE_BYTES', 512 * 1024 * 1024),
+)
+
+
+def get_derivative_url(field_file, size_name: str) -> str:
+    """获取 ``ImageField`` 中图片某个尺寸的访问地址。"""
+    name = derivative_cache.get(Path(field_file.path), size_name)
+    return field_file.storage.url(name.replace(os.sep, '/'))
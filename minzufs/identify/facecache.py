@@ -0,0 +1,80 @@
+import json
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.utils import timezone
+
+
+class FaceDetectionCache:
+    """
+    以图片内容的哈希为键、保存在数据库中的人脸检测结果。
+
+    条目数量超过 ``max_entries`` 时删除最久没有使用的条目；每次检测结果命中时更新使用时间。
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+
+    @staticmethod
+    def _face(entry):
+        face = {'top': entry.top, 'left': entry.left, 'width': entry.width, 'height': entry.height}
+        if entry.landmarks:
+            face['landmarks'] = json.loads(entry.landmarks)
+        return face
+
+    def get_many(self, content_hashes, backend) -> dict:
+        """
+        :return: {哈希: 人脸框} ，只包含命中的图片
+        """
+        from .models import FaceDetection
+
+        entries = FaceDetection.objects.filter(content_hash__in=set(content_hashes), backend=backend)
+        found = {entry.content_hash: self._face(entry) for entry in entries}
+        if found:
+            FaceDetection.objects.filter(content_hash__in=found, backend=backend).update(last_used=timezone.now())
+        return found
+
+    def set(self, content_hash, backend, face):
+        from .models import FaceDetection
+
+        landmarks = face.get('landmarks')
+        try:
+            FaceDetection.objects.update_or_create(content_hash=content_hash, backend=backend, defaults={
+                'top': face['top'], 'left': face['left'], 'width': face['width'], 'height': face['height'],
+                'landmarks': json.dumps(landmarks) if landmarks else None,
+            })
+        except IntegrityError:
+            # 另一个线程同时写入了同一张图片的结果
+            return
+        self._evict()
+
+    def _evict(self):
+        from .models import FaceDetection
+
+        # 超出 10% 以后才清理，避免每次写入都删除
+        count = FaceDetection.objects.count()
+        if count <= self.max_entries * 1.1:
+            return
+        stale = FaceDetection.objects.order_by('-last_used').values_list('pk', flat=True)[self.max_entries:]
+        FaceDetection.objects.filter(pk__in=list(stale)).delete()
+
+    def detect_many(self, backend, images) -> list:
+        """
+        检测多张图片的人脸，命中缓存的图片跳过检测
+        :param backend: ``FaceBackend``
+        :param images: ``FaceImage`` 的列表
+        """
+        hashes = [image.sha256 for image in images]
+        faces = self.get_many(hashes, backend.cache_key)
+        missing = [(content_hash, image) for content_hash, image in zip(hashes, images) if content_hash not in faces]
+        # 同一张图片只检测一次
+        missing = list(dict(missing).items())
+        if missing:
+            detected = backend.detect_many([image for _, image in missing])
+            for (content_hash, _), face in zip(missing, detected):
+                faces[content_hash] = face
+                self.set(content_hash, backend.cache_key, face)
+        return [faces[content_hash] for content_hash in hashes]
+
+
+face_cache = FaceDetectionCache(getattr(settings, 'IDENTIFY_FACE_CACHE_MAX_ENTRIES', 10000))
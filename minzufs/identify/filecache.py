@@ -0,0 +1,62 @@
+"""
+按总大小淘汰的文件缓存，图片的衍生尺寸（ ``derivatives`` ）和合成用的人像（ ``lib.cutouts`` ）都基于它。
+"""
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+
+class FileCache:
+    """
+    保存在一个目录中、总大小有上限的文件缓存。
+    文件的修改时间作为访问时间，超过上限时删除最久没有访问的文件。
+    """
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._total = None  # 缓存目录的总大小，第一次使用时统计一次
+        self._lock = threading.Lock()
+
+    def _files(self):
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    yield path, os.stat(path)
+                except FileNotFoundError:
+                    pass
+
+    def _add(self, path: Path, size):
+        with self._lock:
+            if self._total is None:
+                self._total = sum(stat.st_size for _, stat in self._files())
+            else:
+                self._total += size
+            if self._total > self.max_bytes:
+                self._evict(keep=str(path))
+
+    def _evict(self, keep=None):
+        """按访问时间从旧到新删除，直到总大小降到上限的 90% ，刚刚生成的文件 ``keep`` 不会被删除。"""
+        files = sorted(self._files(), key=lambda item: item[1].st_mtime)
+        self._total = sum(stat.st_size for _, stat in files)
+        for path, stat in files:
+            if self._total <= self.max_bytes * 0.9:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._total -= stat.st_size
+
+    def _write(self, path: Path, write):
+        """先写入临时文件再重命名，并发生成同一个文件时不会读到不完整的文件。"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=path.suffix)
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp, path)
+        self._add(path, path.stat().st_size)
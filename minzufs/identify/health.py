@@ -0,0 +1,75 @@
+"""
+服务的就绪状态。
+
+开启 ``settings.IDENTIFY_WARMUP`` 时，服务进程（ ``wsgi.py`` 、 ``asgi.py`` ）启动后在后台加载模型并预热，
+预热完成前就绪检查返回未就绪，负载均衡可以等到就绪后再转发请求。 ``migrate`` 等管理命令不会预热。
+合成用的背景同时预加载，加载失败只记录错误，不影响就绪状态。
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger('django')
+
+
+class Readiness:
+    NOT_STARTED, WARMING, READY, FAILED = 'not-started', 'warming', 'ready', 'failed'
+
+    def __init__(self):
+        self.state = self.NOT_STARTED
+        self.error = None
+        self.backgrounds_error = None
+        self.duration = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_ready(self) -> bool:
+        # 没有开启预热时不需要等待
+        if not getattr(settings, 'IDENTIFY_WARMUP', False):
+            return True
+        return self.state == self.READY
+
+    def warm_up(self):
+        """加载模型并对每一种批次大小做一次预测，然后加载合成用的背景，同一时间只会执行一次。"""
+        from .lib.backgrounds import preload_backgrounds
+        from .predict import warm_up
+
+        with self._lock:
+            if self.state in (self.WARMING, self.READY):
+                return
+            self.state = self.WARMING
+        start = time.perf_counter()
+        try:
+            warm_up(getattr(settings, 'IDENTIFY_WARMUP_BATCH_SIZES', None))
+        except Exception as e:
+            self.state, self.error = self.FAILED, str(e)
+            logger.exception('model warm-up failed')
+            return
+        self.duration = time.perf_counter() - start
+        self.state, self.error = self.READY, None
+        logger.info(f'model warm-up finished in {self.duration:.2f}s')
+        # 背景只影响合成，加载失败时合成会在使用时重新加载并报错
+        try:
+            preload_backgrounds()
+        except Exception as e:
+            self.backgrounds_error = str(e)
+            logger.exception('background preload failed')
+
+    def start(self):
+        """在后台线程中预热，不阻塞进程启动。"""
+        threading.Thread(target=self.warm_up, name='identify-warm-up', daemon=True).start()
+
+    def as_dict(self):
+        return {'ready': self.is_ready, 'state': self.state, 'error': self.error, 'warm_up_seconds': self.duration,
+                'backgrounds_error': self.backgrounds_error}
+
+
+readiness = Readiness()
+
+
+def start_server_warm_up():
+    """在服务进程加载应用之后调用，开启 ``settings.IDENTIFY_WARMUP`` 时在后台预热。"""
+    if getattr(settings, 'IDENTIFY_WARMUP', False):
+        readiness.start()
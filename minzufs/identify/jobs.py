@@ -0,0 +1,94 @@
+"""
+进程内的后台任务队列。
+
+不依赖任何外部的消息队列，任务提交到本进程的线程池中执行，任务的状态记录在数据库里，
+前端通过轮询对应对象的状态获得进度。
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.db import connections, transaction
+
+logger = logging.getLogger('django')
+
+# 各个线程池的线程数量对应的配置项，识别和合成分开，合成任务不会占满识别的线程
+_POOL_SETTINGS = {
+    'identify': ('IDENTIFY_JOB_WORKERS', 2),
+    'merge': ('IDENTIFY_MERGE_WORKERS', 1),
+    # 一次合成到多个背景时并行混合各个背景，单独的线程池，合成任务中等待它不会死锁
+    'render': ('IDENTIFY_RENDER_WORKERS', 4),
+}
+_executors = {}
+_executor_lock = threading.Lock()
+
+
+def get_executor(name='identify') -> ThreadPoolExecutor:
+    """后台线程池，线程数量由 ``_POOL_SETTINGS`` 中对应的配置项指定。"""
+    executor = _executors.get(name)
+    if executor is None:
+        with _executor_lock:
+            executor = _executors.get(name)
+            if executor is None:
+                setting, default = _POOL_SETTINGS[name]
+                executor = _executors[name] = ThreadPoolExecutor(
+                    max_workers=getattr(settings, setting, default), thread_name_prefix=f'{name}-job')
+    return executor
+
+
+_stage_limits = {}
+
+
+def stage_limit(name):
+    """
+    限制某个计算密集的阶段同时执行的数量，上限由 ``settings.IDENTIFY_MERGE_STAGE_LIMITS`` 配置，
+    没有配置的阶段不限制。
+    """
+    semaphore = _stage_limits.get(name)
+    if semaphore is None:
+        limit = getattr(settings, 'IDENTIFY_MERGE_STAGE_LIMITS', {}).get(name)
+        if not limit:
+            return nullcontext()
+        with _executor_lock:
+            semaphore = _stage_limits.setdefault(name, threading.BoundedSemaphore(limit))
+    return semaphore
+
+
+def _run(fn, *args):
+    try:
+        return fn(*args)
+    except Exception:
+        logger.exception(f'background job {fn.__name__}{args} failed')
+        raise
+    finally:
+        # 后台线程使用的数据库连接不会被请求结束时的信号关闭，需要手动关闭
+        connections.close_all()
+
+
+def submit(fn, *args, pool='identify'):
+    """在当前事务提交后，把任务放入线程池执行。"""
+    transaction.on_commit(lambda: get_executor(pool).submit(_run, fn, *args))
+
+
+def identify_image_post(pk):
+    """后台识别一张已经上传的图片。"""
+    from .models import ImagesPost
+
+    ImagesPost.objects.get(pk=pk).identify()
+
+
+def submit_identify(pk):
+    submit(identify_image_post, pk)
+
+
+def merge_merged_image(pk):
+    """后台执行图像合成，进度和错误记录在对象的 status 、 error_message 中。"""
+    from .models import MergedImageModel
+
+    MergedImageModel.objects.get(pk=pk).merge()
+
+
+def submit_merge(pk):
+    submit(merge_merged_image, pk, pool='merge')
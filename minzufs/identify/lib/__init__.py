@@ -1 +1,25 @@
-from .mergeimages import merge_images
+"""
+图像合成相关的工具。
+
+子模块依赖 paddlehub 、 OpenCV 等较重的库，只在第一次使用时导入，
+``identify.models`` 导入本包时不会加载它们。
+"""
+import importlib
+
+_SUBMODULES = {'backgrounds', 'changeface', 'changestyle', 'cutouts', 'facebackends', 'mergeimages', 'segmentation'}
+
+
+def merge_images(*args, **kwargs):
+    from .mergeimages import merge_images
+    return merge_images(*args, **kwargs)
+
+
+def render_backgrounds(*args, **kwargs):
+    from .mergeimages import render_backgrounds
+    return render_backgrounds(*args, **kwargs)
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module(f'{__name__}.{name}')
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
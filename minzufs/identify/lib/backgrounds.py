@@ -0,0 +1,141 @@
+"""
+合成使用的背景图片。
+
+每张背景在进程内只解码一次并常驻内存，同时带有预先计算好的人物摆放位置，
+合成时只需要处理人像本身并完成混合。
+开启 ``settings.IDENTIFY_BACKGROUND_MMAP`` 时，解码后的像素保存为 ``.npy`` 文件并以内存映射的方式打开，
+多个 worker 进程共享操作系统的页缓存，不会各自保存一份。
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, NamedTuple, Tuple
+
+import cv2
+import numpy as np
+from django.conf import settings
+
+BACKGROUND_IMAGE_DIR = Path(settings.MEDIA_ROOT) / 'background-image'
+BACKGROUND_LIST: Dict[str, Path] = {f'bg{i}': BACKGROUND_IMAGE_DIR / f'bg{i}.png' for i in range(1, 7)}
+
+
+class PlacementSlot(NamedTuple):
+    """人物在背景中的位置：按 ``ratio`` 缩放人像，左边与 ``left`` 对齐，底边与背景底边对齐。"""
+    ratio: float
+    left: int
+
+
+# 默认的摆放位置，依次对应第一个人和第二个人
+DEFAULT_SLOTS = (PlacementSlot(0.5, 230), PlacementSlot(0.7, 80))
+# 个别背景需要不同的摆放位置时在这里配置
+BACKGROUND_SLOTS: Dict[str, Tuple[PlacementSlot, ...]] = {}
+
+
+class Background:
+    def __init__(self, name, path: Path, image: np.ndarray, slots=DEFAULT_SLOTS):
+        self.name = name
+        self.path = path
+        self.image = image
+        self.height, self.width = image.shape[:2]
+        self.slots = slots
+        # 每个位置可用的最大宽度，以及人像高度不能超过背景高度
+        self._max_widths = tuple(max(self.width - slot.left, 0) for slot in slots)
+
+    def canvas(self) -> np.ndarray:
+        """一份可以修改的背景像素。"""
+        return np.array(self.image, copy=True)
+
+    def placement(self, index, fg_shape):
+        """
+        计算第 ``index`` 个人像在背景中的区域
+        :param fg_shape: 人像图片的形状
+        :return: (top, left, height, width)
+        """
+        slot = self.slots[index]
+        height_fg, width_fg = fg_shape[:2]
+        ratio = min(max(slot.ratio, 0.1), self.height / height_fg)
+        height = min(int(height_fg * ratio), self.height)
+        width = min(int(width_fg * ratio), self._max_widths[index])
+        return self.height - height, slot.left, height, width
+
+
+def _mmap_path(path: Path) -> Path:
+    stat = path.stat()
+    return path.parent / '.cache' / f'{path.stem}-{stat.st_mtime_ns}-{stat.st_size}.npy'
+
+
+def _decode(path: Path) -> np.ndarray:
+    image = cv2.imread(str(path), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError(f'Unable to read the background image {path}.')
+    return image
+
+
+def _load_mmap(path: Path) -> np.ndarray:
+    """读取解码后的像素缓存，不存在时先解码并写入缓存。"""
+    cache = _mmap_path(path)
+    if not cache.exists():
+        cache.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=cache.parent, suffix='.npy')
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, _decode(path))
+        os.replace(tmp, cache)
+    return np.load(cache, mmap_mode='r')
+
+
+_backgrounds: Dict[str, Background] = {}
+_lock = threading.Lock()
+
+
+def get_background(name) -> Background:
+    """获取常驻内存的背景。"""
+    background = _backgrounds.get(name)
+    if background is not None:
+        return background
+    with _lock:
+        background = _backgrounds.get(name)
+        if background is None:
+            path = BACKGROUND_LIST[name]
+            if getattr(settings, 'IDENTIFY_BACKGROUND_MMAP', False):
+                image = _load_mmap(path)
+            else:
+                image = _decode(path)
+                image.flags.writeable = False
+            background = _backgrounds[name] = Background(name, path, image, BACKGROUND_SLOTS.get(name, DEFAULT_SLOTS))
+    return background
+
+
+def max_placement_scale(fg_shape) -> float:
+    """人像在所有背景、所有位置中被缩放的最大比例，缓存的人像只需要保留到这个大小。"""
+    height_fg, width_fg = fg_shape[:2]
+    scale = 0.0
+    for name, path in BACKGROUND_LIST.items():
+        if not path.exists():
+            continue
+        background = get_background(name)
+        for index in range(len(background.slots)):
+            _, _, height, width = background.placement(index, fg_shape)
+            scale = max(scale, height / height_fg, width / width_fg)
+    return scale or 1.0
+
+
+def placement_signature() -> str:
+    """
+    所有背景的摆放参数的摘要：存在哪些背景文件（修改时间、大小）以及各自的摆放位置。
+    ``max_placement_scale`` 只取决于这些参数，按它缩小保存的人像缓存以此为键的一部分，参数变化后缓存随之失效。
+    """
+    parts = []
+    for name, path in BACKGROUND_LIST.items():
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        parts.append(f'{name}:{stat.st_mtime_ns}:{stat.st_size}:{BACKGROUND_SLOTS.get(name, DEFAULT_SLOTS)}')
+    return hashlib.sha256('|'.join(parts).encode()).hexdigest()[:16]
+
+
+def preload_backgrounds():
+    """加载全部存在的背景，用于启动时预热。"""
+    return [get_background(name) for name, path in BACKGROUND_LIST.items() if path.exists()]
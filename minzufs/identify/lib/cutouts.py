@@ -0,0 +1,98 @@
+"""
+换脸并分割后的人像缓存。
+
+人像只取决于（服饰图片, 头像图片）这一对输入，与使用哪个背景无关。以两张图片内容的哈希、换脸后端、分割模型
+以及背景的摆放参数（决定缩小的比例）为键，
+把 BGRA 人像保存为 PNG 到 ``MEDIA_ROOT/merge-cutouts`` ；任何一张图片变化后键随之变化，旧的文件按访问时间被淘汰。
+更换背景重新合成时只需要重新混合。
+
+保存的人像经过 ``compact`` ：只保留透明通道不为 0 的区域，透明处的颜色置 0 ，并缩小到所有背景中最大的摆放尺寸；
+原始人像的大小和裁剪区域写在 PNG 的文本块中，合成时据此还原摆放位置。
+"""
+import hashlib
+import io
+import json
+import os
+from pathlib import Path
+from typing import NamedTuple, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image, PngImagePlugin
+from django.conf import settings
+
+from .backgrounds import max_placement_scale, placement_signature
+from .facebackends import FaceImage, get_face_backend
+from .segmentation import HUMANSEG_MODULE_NAME
+from ..filecache import FileCache
+
+CUTOUT_DIR = 'merge-cutouts'
+
+
+class Cutout(NamedTuple):
+    """裁剪后的人像"""
+    image: np.ndarray  # 裁剪区域的 BGRA 图片，可能已经缩小
+    shape: Tuple[int, int]  # 原始人像的 (height, width) ，用于计算摆放位置
+    box: Tuple[int, int, int, int]  # 裁剪区域在原始人像中的 (top, left, height, width)
+
+
+def compact(image: np.ndarray) -> Cutout:
+    """
+    裁剪、缩小分割出的人像
+    :param image: 原始大小的 BGRA 人像
+    """
+    shape = image.shape[:2]
+    left, top, width, height = cv2.boundingRect(image[:, :, 3])
+    if not width or not height:
+        # 没有分割出人像，保留一个透明的像素
+        return Cutout(np.zeros((1, 1, 4), np.uint8), shape, (0, 0, 1, 1))
+    cropped = image[top: top + height, left: left + width].copy()
+    cropped[cropped[:, :, 3] == 0, :3] = 0
+    scale = max_placement_scale(shape)
+    if scale < 1:
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        cropped = cv2.resize(cropped, size, interpolation=cv2.INTER_AREA)
+    return Cutout(cropped, shape, (top, left, height, width))
+
+
+class CutoutCache(FileCache):
+    def key(self, template: FaceImage, extract: FaceImage, rate) -> str:
+        parts = (template.sha256, extract.sha256, get_face_backend().cache_key, HUMANSEG_MODULE_NAME, str(rate),
+                 placement_signature())
+        return hashlib.sha256(':'.join(parts).encode()).hexdigest()
+
+    def _path(self, key) -> Path:
+        return self.root / key[:2] / f'{key}.png'
+
+    def get(self, key):
+        """:return: ``Cutout`` ，没有缓存时返回 None"""
+        path = self._path(key)
+        if not path.exists():
+            return None
+        try:
+            with Image.open(path) as img:
+                meta = json.loads(img.text['cutout'])
+                image = cv2.cvtColor(np.asarray(img.convert('RGBA')), cv2.COLOR_RGBA2BGRA)
+        except (OSError, KeyError, ValueError):
+            return None
+        # 更新修改时间，作为淘汰时的访问时间
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return Cutout(image, tuple(meta['shape']), tuple(meta['box']))
+
+    def set(self, key, cutout: Cutout):
+        info = PngImagePlugin.PngInfo()
+        info.add_text('cutout', json.dumps({'shape': list(cutout.shape), 'box': list(cutout.box)}))
+        buf = io.BytesIO()
+        # 人像只在服务端使用，用较快的压缩级别
+        Image.fromarray(cv2.cvtColor(cutout.image, cv2.COLOR_BGRA2RGBA)).save(buf, 'PNG', pnginfo=info,
+                                                                              compress_level=3)
+        self._write(self._path(key), lambda f: f.write(buf.getvalue()))
+
+
+cutout_cache = CutoutCache(
+    Path(settings.MEDIA_ROOT) / CUTOUT_DIR,
+    getattr(settings, 'IDENTIFY_CUTOUT_CACHE_BYTES', 256 * 1024 * 1024),
+)
@@ -0,0 +1,239 @@
+"""
+人脸检测和换脸的后端。
+
+``facepp`` 通过 ``facepp.FacePlusPlusClient`` 调用 Face++ 的云端接口； ``opencv`` 完全在本地 CPU 上运行，不依赖网络：
+使用 OpenCV 的人脸检测器找到人脸（配置了 YuNet 模型时同时得到五个关键点），
+按照关键点（或人脸框）对齐后，通过泊松融合（ ``cv2.seamlessClone`` ）把人脸贴到模板上。
+通过 ``settings.IDENTIFY_FACE_BACKEND`` 选择后端。
+"""
+import hashlib
+import threading
+from pathlib import Path
+
+import cv2
+import numpy as np
+from django.conf import settings
+from django.utils.functional import cached_property
+
+from .facepp import decode, get_client
+from ..metrics import stage
+
+
+class FaceImage:
+    """参与换脸的图片，按需读取文件内容、解码为数组。"""
+
+    def __init__(self, path=None, content: bytes = None, array: np.ndarray = None):
+        self.path = path
+        if content is not None:
+            self.__dict__['content'] = content
+        if array is not None:
+            self.__dict__['array'] = array
+
+    @cached_property
+    def content(self) -> bytes:
+        if self.path is not None:
+            return Path(self.path).read_bytes()
+        ok, buf = cv2.imencode('.jpg', self.array, [cv2.IMWRITE_JPEG_QUALITY, 95])
+        return buf.tobytes()
+
+    @cached_property
+    def sha256(self) -> str:
+        if self.path is not None and 'content' not in self.__dict__:
+            sha256 = hashlib.sha256()
+            with open(self.path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    sha256.update(chunk)
+            return sha256.hexdigest()
+        return hashlib.sha256(self.content).hexdigest()
+
+    @cached_property
+    def array(self) -> np.ndarray:
+        image = cv2.imdecode(np.frombuffer(self.content, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError(f'Unable to decode the image {self.path or ""}.')
+        return image
+
+
+class FaceBackend:
+    """
+    换脸后端的接口
+    ``detect`` 返回人脸框 ``{'top', 'left', 'width', 'height'}`` ，可能带有 ``landmarks`` （若干个 [x, y] ）；
+    ``swap`` 把 ``extract`` 中的人脸换到 ``template`` 上，返回 BGR 图片。
+    """
+    name = None
+
+    @property
+    def cache_key(self):
+        """人脸检测缓存中区分后端的键，检测结果会变化时应当随之变化。"""
+        return self.name
+
+    def detect(self, image: FaceImage) -> dict:
+        raise NotImplementedError
+
+    def detect_many(self, images) -> list:
+        return [self.detect(image) for image in images]
+
+    def swap(self, template: FaceImage, template_face: dict, extract: FaceImage, extract_face: dict,
+             rate) -> np.ndarray:
+        raise NotImplementedError
+
+    def swap_many(self, swaps, rate) -> list:
+        """
+        :param swaps: (template, template_face, extract, extract_face) 的列表
+        :return: 与输入一一对应的换脸结果
+        """
+        return [self.swap(*args, rate) for args in swaps]
+
+    def merge_many(self, pairs, rate, timer=None) -> list:
+        """
+        对多对 (template, extract) 换脸：所有图片的人脸检测一起提交，然后所有的换脸一起提交，
+        分别记录 face_detection 和 face_swap 阶段的耗时
+        """
+        with stage(timer, 'face_detection'):
+            faces = detect_faces(self, [image for pair in pairs for image in pair])
+        swaps = [(template, faces[2 * i], extract, faces[2 * i + 1]) for i, (template, extract) in enumerate(pairs)]
+        with stage(timer, 'face_swap'):
+            return self.swap_many(swaps, rate)
+
+    def merge(self, template: FaceImage, extract: FaceImage, rate, timer=None) -> np.ndarray:
+        """检测两张图片的人脸并换脸，分别记录 face_detection 和 face_swap 阶段的耗时。"""
+        return self.merge_many([(template, extract)], rate, timer)[0]
+
+
+class FacePlusPlusBackend(FaceBackend):
+    """调用 Face++ 云端接口，多张图片的人脸检测、多对图片的换脸都在客户端的线程池中同时进行。"""
+    name = 'facepp'
+
+    def __init__(self):
+        self.client = get_client()
+
+    def detect(self, image):
+        return self.client.detect(image)
+
+    def detect_many(self, images):
+        return self.client.detect_many(images)
+
+    def swap(self, template, template_face, extract, extract_face, rate):
+        return decode(self.client.merge(template, template_face, extract, extract_face, rate))
+
+    def swap_many(self, swaps, rate):
+        return [decode(content) for content in self.client.merge_many(swaps, rate)]
+
+
+class OpenCVFaceBackend(FaceBackend):
+    """
+    本地的换脸后端
+    ``settings.IDENTIFY_YUNET_MODEL`` 指向 YuNet 的 ONNX 模型时使用 ``cv2.FaceDetectorYN`` 检测人脸和关键点，
+    否则使用 Haar 级联分类器，只有人脸框，对齐时使用人脸框的缩放和平移。
+    """
+    name = 'opencv'
+
+    def __init__(self):
+        self._lock = threading.Lock()  # 检测器不能被多个线程同时使用
+        model = getattr(settings, 'IDENTIFY_YUNET_MODEL', None)
+        if model and Path(model).exists() and hasattr(cv2, 'FaceDetectorYN'):
+            self._yunet = cv2.FaceDetectorYN.create(str(model), '', (320, 320), 0.7)
+            self._cascade = None
+        else:
+            # OpenCV 5 把 Haar 级联分类器移到了 contrib 中，此时必须提供 YuNet 模型
+            if not hasattr(cv2, 'CascadeClassifier'):
+                raise ValueError(f'The YuNet model {model} does not exist and this OpenCV build has no '
+                                 f'CascadeClassifier, download the model (see IDENTIFY_YUNET_MODEL in settings) '
+                                 f'or install opencv-python<5.')
+            cascade = getattr(settings, 'IDENTIFY_HAAR_CASCADE', None) or str(
+                Path(cv2.data.haarcascades) / 'haarcascade_frontalface_default.xml')
+            self._yunet = None
+            self._cascade = cv2.CascadeClassifier(cascade)
+            if self._cascade.empty():
+                raise ValueError(f'Unable to load the face detector {cascade}.')
+
+    @property
+    def cache_key(self):
+        return f'{self.name}-yunet' if self._yunet is not None else f'{self.name}-haar'
+
+    def detect(self, image):
+        img = image.array
+        with self._lock:
+            if self._yunet is not None:
+                self._yunet.setInputSize((img.shape[1], img.shape[0]))
+                _, faces = self._yunet.detect(img)
+                if faces is None or not len(faces):
+                    raise ValueError('No face detected.')
+                face = faces[np.argmax(faces[:, -1])]
+                x, y, w, h = (int(round(v)) for v in face[:4])
+                return {'top': y, 'left': x, 'width': w, 'height': h, 'landmarks': face[4:14].reshape(5, 2).tolist()}
+            gray = cv2.equalizeHist(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY))
+            min_size = max(24, min(gray.shape) // 10)
+            faces = self._cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(min_size, min_size))
+        if not len(faces):
+            raise ValueError('No face detected.')
+        x, y, w, h = (int(v) for v in max(faces, key=lambda f: f[2] * f[3]))
+        return {'top': y, 'left': x, 'width': w, 'height': h}
+
+    @staticmethod
+    def _transform(template_face, extract_face):
+        """从 extract 到 template 的相似变换矩阵。"""
+        src, dst = extract_face.get('landmarks'), template_face.get('landmarks')
+        if src and dst:
+            matrix, _ = cv2.estimateAffinePartial2D(np.float32(src), np.float32(dst))
+            if matrix is not None:
+                return matrix
+        scale = template_face['width'] / extract_face['width']
+        src_center = (extract_face['left'] + extract_face['width'] / 2, extract_face['top'] + extract_face['height'] / 2)
+        dst_center = (template_face['left'] + template_face['width'] / 2,
+                      template_face['top'] + template_face['height'] / 2)
+        return np.float32([[scale, 0, dst_center[0] - scale * src_center[0]],
+                           [0, scale, dst_center[1] - scale * src_center[1]]])
+
+    def swap(self, template, template_face, extract, extract_face, rate):
+        target, source = template.array, extract.array
+        height, width = target.shape[:2]
+        matrix = self._transform(template_face, extract_face)
+        warped = cv2.warpAffine(source, matrix, (width, height), flags=cv2.INTER_LINEAR,
+                                borderMode=cv2.BORDER_REFLECT)
+        # 人脸区域的椭圆蒙版，只保留变换后有内容的部分，并离开图片边缘，满足 seamlessClone 的要求
+        mask = np.zeros((height, width), np.uint8)
+        center = (template_face['left'] + template_face['width'] // 2,
+                  template_face['top'] + template_face['height'] // 2)
+        axes = (max(1, int(template_face['width'] * 0.45)), max(1, int(template_face['height'] * 0.55)))
+        cv2.ellipse(mask, center, axes, 0, 0, 360, 255, -1)
+        valid = cv2.warpAffine(np.full(source.shape[:2], 255, np.uint8), matrix, (width, height))
+        mask = cv2.bitwise_and(mask, valid)
+        mask[:2, :], mask[-2:, :], mask[:, :2], mask[:, -2:] = 0, 0, 0, 0
+        if not mask.any():
+            raise ValueError('The face is outside of the template image.')
+        # merge_rate 与 Face++ 的含义相同，0~100 ，数值越大越接近提取的人脸
+        alpha = min(max(float(rate), 0), 100) / 100
+        if alpha < 1:
+            warped = cv2.addWeighted(warped, alpha, target, 1 - alpha, 0)
+        x, y, w, h = cv2.boundingRect(mask)
+        return cv2.seamlessClone(warped, target, mask, (x + w // 2, y + h // 2), cv2.NORMAL_CLONE)
+
+
+def detect_faces(backend: FaceBackend, images) -> list:
+    """检测多张图片的人脸，开启 ``settings.IDENTIFY_FACE_CACHE`` 时使用人脸检测缓存。"""
+    if not getattr(settings, 'IDENTIFY_FACE_CACHE', False):
+        return backend.detect_many(images)
+    from ..facecache import face_cache
+
+    return face_cache.detect_many(backend, images)
+
+
+FACE_BACKENDS = {backend.name: backend for backend in (FacePlusPlusBackend, OpenCVFaceBackend)}
+
+_backends = {}
+_lock = threading.Lock()
+
+
+def get_face_backend(name=None) -> FaceBackend:
+    """获取进程内共享的换脸后端，默认为 ``settings.IDENTIFY_FACE_BACKEND`` 。"""
+    name = name or getattr(settings, 'IDENTIFY_FACE_BACKEND', None) or 'facepp'
+    backend = _backends.get(name)
+    if backend is None:
+        with _lock:
+            backend = _backends.get(name)
+            if backend is None:
+                if name not in FACE_BACKENDS:
+                    raise ValueError(f'Unknown face backend {name!r}, choose from {", ".join(FACE_BACKENDS)}.')
+                backend = _backends[name] = FACE_BACKENDS[name]()
+    return backend
@@ -0,0 +1,100 @@
+"""
+本地的 Face++ 替身服务，用于离线压测合成流程。
+
+实现了 detect 和 mergeface 两个接口：检测总是返回图片中上部的一个人脸框和关键点，换脸直接返回模板图片；
+``latency`` 模拟云端接口的响应时间， ``concurrency_limit`` 模拟并发限制：
+同时处理的请求超过上限时返回 403 CONCURRENCY_LIMIT_EXCEEDED 。
+"""
+import base64
+import json
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+import cv2
+import numpy as np
+
+from .facepp import CONCURRENCY_LIMIT_EXCEEDED, DETECT_PATH, LANDMARK_NAMES, MERGE_PATH
+
+
+def parse_form(content_type, body):
+    """解析 multipart/form-data 或者 urlencoded 的请求体，返回 {字段名: bytes} 。"""
+    if content_type.startswith('multipart/'):
+        message = BytesParser(policy=HTTP).parsebytes(
+            b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + body)
+        return {part.get_param('name', header='content-disposition'): part.get_payload(decode=True)
+                for part in message.iter_parts()}
+    return {k: v.encode() for k, v in parse_qsl(body.decode())}
+
+
+def _image(form, name):
+    content = form.get(f'{name}_file')
+    if content is None and f'{name}_base64' in form:
+        content = base64.b64decode(form[f'{name}_base64'])
+    return content
+
+
+class FacePlusPlusMockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # 支持保持连接
+    latency = 0.0
+    concurrency = None  # 限制并发时为 threading.BoundedSemaphore
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.concurrency is not None and not self.concurrency.acquire(blocking=False):
+            return self.respond(403, {'error_message': CONCURRENCY_LIMIT_EXCEEDED})
+        try:
+            self.handle_api(body)
+        finally:
+            self.concurrency is not None and self.concurrency.release()
+
+    def handle_api(self, body):
+        form = parse_form(self.headers.get('Content-Type', ''), body)
+        time.sleep(self.latency)
+        if self.path == DETECT_PATH:
+            status, result = self.detect(_image(form, 'image'))
+        elif self.path == MERGE_PATH:
+            status, result = self.merge(_image(form, 'template'))
+        else:
+            status, result = 404, {'error_message': 'API_NOT_FOUND'}
+        self.respond(status, result)
+
+    def respond(self, status, result):
+        content = json.dumps(result).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    @staticmethod
+    def detect(content):
+        image = cv2.imdecode(np.frombuffer(content, np.uint8), cv2.IMREAD_REDUCED_COLOR_4) if content else None
+        if image is None:
+            return 400, {'error_message': 'INVALID_IMAGE_SIZE: image_file'}
+        height, width = (side * 4 for side in image.shape[:2])
+        side = min(width, height) // 3
+        top, left = height // 5, (width - side) // 2
+        rectangle = {'top': top, 'left': left, 'width': side, 'height': side}
+        # 按照人脸框的比例放置的关键点
+        points = dict(zip(LANDMARK_NAMES, ((0.3, 0.35), (0.7, 0.35), (0.5, 0.55), (0.35, 0.75), (0.65, 0.75))))
+        landmark = {name: {'x': left + int(x * side), 'y': top + int(y * side)} for name, (x, y) in points.items()}
+        return 200, {'faces': [{'face_rectangle': rectangle, 'landmark': landmark}], 'face_num': 1}
+
+    @staticmethod
+    def merge(content):
+        if not content:
+            return 400, {'error_message': 'MISSING_ARGUMENTS: template_file'}
+        return 200, {'result': base64.b64encode(content).decode()}
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(host='127.0.0.1', port=8765, latency=0.0, concurrency_limit=None) -> ThreadingHTTPServer:
+    concurrency = threading.BoundedSemaphore(concurrency_limit) if concurrency_limit else None
+    handler = type('Handler', (FacePlusPlusMockHandler,), {'latency': latency, 'concurrency': concurrency})
+    return ThreadingHTTPServer((host, port), handler)
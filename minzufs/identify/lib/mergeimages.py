@@ -1,113 +1,85 @@
-import shutil
-import tempfile
-from pathlib import Path
-from typing import Dict
-
 import cv2
-import matplotlib.pyplot as plt
 import numpy as np
-import paddlehub as hub
-from PIL import Image
+from django.conf import settings
 
-from minzufs import settings
-from .changeface import merge_face
+from .backgrounds import BACKGROUND_IMAGE_DIR, BACKGROUND_LIST, get_background
+from .changeface import merge_faces
+from .cutouts import compact, cutout_cache
+from .facebackends import FaceImage
+from .segmentation import segment_people
+from ..jobs import get_executor, stage_limit
+from ..metrics import stage
 
 """
   本脚本完成了放入头像、服饰图片后，进行共同背景的替换
 
 """
 
+# 换脸的相似度，与 Face++ 的 merge_rate 相同
+FACE_MERGE_RATE = 100
+
+
+def _report(progress, status):
+    progress is not None and progress(status)
 
-def change_face_and_extract(template_path, extract_path, dst_path: Path):
+
+def change_faces_and_extract(pairs, timer=None, progress=None):
     """
-    【调用】换脸
-    face_result_path 变脸存放路径
-    :param template_path:
-    :param extract_path:
-    :param dst_path: 之後的路徑
+    【调用】换脸，然后在一次调用中分割出所有的人像；开启 ``settings.IDENTIFY_CUTOUT_CACHE`` 时，
+    已经处理过的（服饰, 头像）直接使用缓存的人像
+    :param pairs: (被换脸的图片路径, 提取人脸的图片路径) 的列表
+    :param timer: ``StageTimer`` ，记录换脸和分割的耗时
+    :param progress: 进入各个阶段时调用，参数为 ``face-swap`` 、 ``segmenting``
+    :return: 与输入一一对应的 ``Cutout``
     """
-    face_path = dst_path.parent / f'{dst_path.stem}-face.png'
-    merge_face(template_path, extract_path, 100, face_path)  # 将变脸返回值（变脸存放路径）赋值给 face_result_path
+    pairs = [(FaceImage(template_path), FaceImage(extract_path)) for template_path, extract_path in pairs]
+    cutouts, keys = [None] * len(pairs), [None] * len(pairs)
+    if getattr(settings, 'IDENTIFY_CUTOUT_CACHE', False):
+        keys = [cutout_cache.key(template, extract, FACE_MERGE_RATE) for template, extract in pairs]
+        cutouts = [cutout_cache.get(key) for key in keys]
+    missing = [index for index, cutout in enumerate(cutouts) if cutout is None]
+    if not missing:
+        return cutouts
+
+    _report(progress, 'face-swap')
+    with stage_limit('face_swap'):
+        # 几对图片的人脸检测、换脸同时提交，不再一对一对地依次等待
+        faces = merge_faces([pairs[index] for index in missing], FACE_MERGE_RATE, timer=timer)
     # 【调用】图像分割
-    test_img_path = [str(face_path)]  # 已经换脸但是待分割人像
-    module = hub.Module(name="deeplabv3p_xception65_humanseg")  # 预加载图像分割模型
-    input_dict = {"image": test_img_path}
-    # execute predict and print the result
-    results = module.segmentation(data=input_dict)  # 根据图像分割模型对待分割图像进行分割  并通过 data 保存
-    for result in results:
-        for key in result.keys():
-            if key == "processed":
-                shutil.copy(result[key], dst_path)
-                # humanseg_output_path = result[key]  # 输出分割后的人像图片路径
-
-
-def blend_images(fg_image: Path, bg_image: Path, ratio, pos=None, align_bottom=True):
-    """
-    将抠出的人物图像换背景
-    :param fg_image: 前景图片，抠出的人物图片
-    :param bg_image: 背景图片
-    :param ratio: 调整前景的比例
-    :param pos: 前景放在背景的位置的，格式为左上角坐标
-    :param align_bottom: 默认使用底边对齐
-    :return:
-    """
-    fg_image, bg_image = str(fg_image), str(bg_image)
-    fg_img = cv2.imread(fg_image)  # read foreground image
-    bg_img = cv2.imread(bg_image)  # read images_bg image
-    height_fg, width_fg, _ = fg_img.shape  # get height and width of foreground image
-    height_bg, width_bg, _ = bg_img.shape  # get height and width of images_bg image
-    if ratio > (height_bg / height_fg):
-        print(f'ratio is too large, use maximum ratio {(height_bg / height_fg): .2}')
-        ratio = round((height_bg / height_fg), 1)
-    if ratio < 0.1:
-        print('ratio < 0.1, use minimum ratio 0.1')
-        ratio = 0.1
-    # if no pos arg input, use this as default
-    if not pos:
-        pos = (height_bg - int(ratio * height_fg), width_bg // 4)  # 底边对齐：hb-hf为纵坐标，//整除,背景图的1//4宽为横坐标
-    elif align_bottom:
-        pos = (height_bg - int(ratio * height_fg), pos[1])
-
-    roi = bg_img[pos[0]: pos[0] + int(height_fg * ratio), pos[1]: pos[1] + int(width_fg * ratio)]  # 背景图片编辑
-    cv2.imwrite("roi.jpg", roi)
-    bg_image = Image.open('roi.jpg').convert('RGB')
-    fg_image = Image.open(fg_image).resize(bg_image.size)
-    # 图片加权合成
-    scope_map = np.array(fg_image)[:, :, -1] / 255
-    scope_map = scope_map[:, :, np.newaxis]
-    scope_map = np.repeat(scope_map, repeats=3, axis=2)
-    res_image = np.multiply(scope_map, np.array(fg_image)[:, :, :3]) + np.multiply((1 - scope_map),
-                                                                                   np.array(bg_image))
-    bg_img[pos[0]: pos[0] + roi.shape[0], pos[1]: pos[1] + roi.shape[1]] = np.uint8(res_image)[:, :, ::-1]
-    return bg_img
-
-
-def merge_fn_path(person_extract_path: Path, src: Path, ratio, pos, del_image, dst: Path):
-    """
-    保存最终合成图片
-    :param person_extract_path: 切割出来的人像路径（要合成到背景的图片路径）
-    :param src: 背景图片路径
-    :param ratio: 调整前景的比例
-    :param pos: 前景放在背景的位置的，格式为左上角坐标
-    :param del_image:下一张图片合到同一张背景时，是否覆盖前一张
-    :param dst: 合成后的图像的生成位置
-    :return: 返回背景替换后的路径
-    """
-    plt.figure(figsize=(10, 10))
-    img = blend_images(person_extract_path, src, ratio, pos, align_bottom=True)
-    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    plt.imshow(img)
-    plt.axis('off')  # 去坐标轴
-    plt.savefig(dst, bbox_inches='tight', pad_inches=-0.1)
-    return dst
+    _report(progress, 'segmenting')
+    with stage_limit('segmentation'), stage(timer, 'segmentation'):
+        segmented = segment_people(faces)
+    for index, image in zip(missing, segmented):
+        cutouts[index] = compact(image)
+        if keys[index] is not None:
+            cutout_cache.set(keys[index], cutouts[index])
+    return cutouts
 
 
-BACKGROUND_IMAGE_DIR = Path(settings.MEDIA_ROOT) / 'background-image'
-BACKGROUND_LIST: Dict[str, Path] = {f'bg{i}': BACKGROUND_IMAGE_DIR / f'bg{i}.png' for i in range(1, 7)}
+def composite(fg_img: np.ndarray, roi: np.ndarray):
+    """
+    把人像缩放到 ``roi`` 的大小，按透明通道混合到 ``roi`` 中
+    使用 uint16 定点数计算 ``(fg * a + bg * (255 - a)) / 255`` 并四舍五入，直接写回 ``roi`` ，不产生浮点的中间结果
+    :param fg_img: 人像图片（ BGRA ）
+    :param roi: 背景中需要放置人像的区域，直接修改
+    """
+    fg = cv2.resize(fg_img, (roi.shape[1], roi.shape[0]))
+    alpha = fg[:, :, 3:].astype(np.uint16)
+    blended = fg[:, :, :3].astype(np.uint16)
+    blended *= alpha
+    np.subtract(255, alpha, out=alpha)
+    background = roi.astype(np.uint16)
+    background *= alpha
+    blended += background
+    # x / 255 的四舍五入：(x + 128 + ((x + 128) >> 8)) >> 8 ，x 最大为 255 * 255 ，不会溢出
+    blended += 128
+    blended += blended >> 8
+    blended >>= 8
+    np.copyto(roi, blended, casting='unsafe')
 
 
 def merge_images(template_path1: str, extract_path1: str, template_path2: str, extract_path2: str,
-                 background_name: str):
+                 background_name: str, timer=None, progress=None):
     """
     合成两张人像分割结果图片到背景
     :param template_path1: 第一个接受换人脸的图片路径
@@ -115,29 +87,88 @@ def merge_images(template_path1: str, extract_path1: str, template_path2: str, e
     :param template_path2: 第二个接受换人脸的图片路径
     :param extract_path2: 第二个提取的人脸图片路径
     :param background_name: 背景图片的名称，只能再有限的给定的选项中进行选择
+    :param timer: ``StageTimer`` ，记录各阶段的耗时
+    :param progress: 进入各个阶段时调用，参数为 ``face-swap`` 、 ``segmenting`` 、 ``blending``
     :return: 二进制的图片数据
     """
 
-    with tempfile.TemporaryDirectory(prefix='minzufs-merge-image') as directory:
-        directory = Path(directory)
-
-        # 分割后的人像图片存放路径（前景图片）
-        face_1_output_path = directory / 'face1.png'
-        change_face_and_extract(template_path1, extract_path1, face_1_output_path)
-        face_2_output_path = directory / 'face2.png'
-        change_face_and_extract(template_path2, extract_path2, face_2_output_path)  # 分割后的人像图片存放路径（前景图片）
-
-        src, dst = BACKGROUND_LIST[background_name], directory / 'first.png'
-        ratio = 0.5
-        pos = (50, 230)
-        merge_fn_path(face_1_output_path, src, ratio, pos, False, dst)
-        src, dst = dst, directory / 'second.png'
-        ratio = 0.7
-        pos = (50, 80)
-        merge_fn_path(face_2_output_path, src, ratio, pos, True, dst)
-        with open(dst, 'rb') as f:
-            content = f.read()
-    return content
+    # 分割后的人像图片（前景图片），全程保存在内存中
+    cutouts = change_faces_and_extract(
+        [(template_path1, extract_path1), (template_path2, extract_path2)], timer, progress)
+
+    _report(progress, 'blending')
+    with stage_limit('blending'), stage(timer, 'blending'):
+        img = blend_background(cutouts, background_name)
+    # 只在最后编码一次
+    with stage(timer, 'encoding'):
+        return encode_png(img)
+
+
+def blend_background(cutouts, background_name: str) -> np.ndarray:
+    """把若干个 ``Cutout`` 按照背景的放置位置依次合成到背景的副本上。"""
+    background = get_background(background_name)
+    img = background.canvas()
+    for index, cutout in enumerate(cutouts):
+        top, left, height, width = background.placement(index, cutout.shape)
+        # 裁剪区域按照整个人像缩放到摆放区域的比例映射到背景中
+        scale_y, scale_x = height / cutout.shape[0], width / cutout.shape[1]
+        box_top, box_left, box_height, box_width = cutout.box
+        y0, y1 = round(box_top * scale_y), round((box_top + box_height) * scale_y)
+        x0, x1 = round(box_left * scale_x), round((box_left + box_width) * scale_x)
+        if y1 > y0 and x1 > x0:
+            composite(cutout.image, img[top + y0: top + y1, left + x0: left + x1])
+    return img
+
+
+def encode_png(img: np.ndarray) -> bytes:
+    ok, content = cv2.imencode('.png', img)
+    if not ok:
+        raise ValueError('Failed to encode the merged image.')
+    return content.tobytes()
+
+
+def render_backgrounds(template_path1: str, extract_path1: str, template_path2: str, extract_path2: str,
+                       background_names, timer=None, progress=None, encode=True) -> dict:
+    """
+    把同一对人像合成到多个背景上：换脸和分割只做一次，各个背景在 ``render`` 线程池中并行混合、编码
+    :param background_names: 背景名称的列表
+    :param encode: 为 False 时返回 BGR 图片，否则返回 PNG 的二进制数据
+    :return: {背景名称: 图片}
+    """
+    cutouts = change_faces_and_extract(
+        [(template_path1, extract_path1), (template_path2, extract_path2)], timer, progress)
+
+    def render(background_name):
+        with stage_limit('blending'), stage(timer, 'blending'):
+            img = blend_background(cutouts, background_name)
+        if not encode:
+            return img
+        with stage(timer, 'encoding'):
+            return encode_png(img)
+
+    _report(progress, 'blending')
+    return dict(zip(background_names, get_executor('render').map(render, background_names)))
+
+
+def contact_sheet(images: dict, columns=3, width=400) -> np.ndarray:
+    """
+    把若干张图片缩小后排列成一张预览图，每张图片的左上角标注名称
+    :param images: {名称: BGR 图片}
+    :param width: 每张图片缩小后的宽度
+    """
+    tiles = []
+    for name, img in images.items():
+        height = round(img.shape[0] * width / img.shape[1])
+        tile = cv2.resize(img, (width, height), interpolation=cv2.INTER_AREA)
+        cv2.putText(tile, name, (8, 28), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2, cv2.LINE_AA)
+        tiles.append(tile)
+    tile_height = max(tile.shape[0] for tile in tiles)
+    rows = -(-len(tiles) // columns)
+    sheet = np.zeros((rows * tile_height, min(columns, len(tiles)) * width, 3), np.uint8)
+    for index, tile in enumerate(tiles):
+        top, left = index // columns * tile_height, index % columns * width
+        sheet[top: top + tile.shape[0], left: left + width] = tile
+    return sheet
 
 
 def test():
@@ -0,0 +1,49 @@
+"""
+人像分割。
+
+分割模型在进程内只加载一次并常驻内存，一次合成中的多个人像在同一次调用中完成分割，
+输入输出都是内存中的数组，不经过磁盘。
+"""
+import threading
+from typing import List
+
+import cv2
+import numpy as np
+
+HUMANSEG_MODULE_NAME = 'deeplabv3p_xception65_humanseg'
+
+_module = None
+_load_lock = threading.Lock()
+# paddle 的预测器不能被多个线程同时使用
+_predict_lock = threading.Lock()
+
+
+def get_humanseg_module():
+    """获取常驻内存的人像分割模型。"""
+    global _module
+    if _module is None:
+        with _load_lock:
+            if _module is None:
+                import paddlehub as hub
+
+                _module = hub.Module(name=HUMANSEG_MODULE_NAME)
+    return _module
+
+
+def segment_people(images: List[np.ndarray]) -> List[np.ndarray]:
+    """
+    对若干张人像图片进行分割
+    :param images: BGR 图片的列表
+    :return: 与输入一一对应的 BGRA 图片，透明通道为人像的蒙版
+    """
+    module = get_humanseg_module()
+    with _predict_lock:
+        results = module.segmentation(images=list(images), batch_size=len(images), visualization=False)
+    cutouts = []
+    for image, result in zip(images, results):
+        mask = np.asarray(result['data'])
+        if mask.shape[:2] != image.shape[:2]:
+            mask = cv2.resize(mask, (image.shape[1], image.shape[0]), interpolation=cv2.INTER_LINEAR)
+        mask = np.clip(mask, 0, 255).astype(np.uint8)
+        cutouts.append(np.dstack((image[:, :, :3], mask)))
+    return cutouts
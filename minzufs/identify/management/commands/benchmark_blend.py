@@ -0,0 +1,28 @@
+from django.core.management import BaseCommand
+
+from identify.benchmarks import blend, dump, environment
+
+
+def _size(value):
+    return tuple(int(v) for v in value.split('x'))
+
+
+class Command(BaseCommand):
+    help = '比较人像合成到背景的各个实现的耗时和内存峰值，结果输出为 JSON 。'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--background', type=_size, default=blend.DEFAULT_BACKGROUND, help='背景尺寸，例如 1200x900')
+        parser.add_argument('--foreground', type=_size, default=blend.DEFAULT_FOREGROUND, help='人像尺寸，例如 600x900')
+        parser.add_argument('--ratio', type=float, default=0.7, help='人像的缩放比例')
+        parser.add_argument('--iterations', type=int, default=20, help='每一项测试的次数')
+        parser.add_argument('--output', help='JSON 结果的保存位置，默认输出到终端')
+
+    def handle(self, *args, **options):
+        result = {
+            'environment': environment(),
+            **blend.run(options['background'], options['foreground'], options['ratio'],
+                        iterations=options['iterations']),
+        }
+        content = dump(result, options['output'])
+        if not options['output']:
+            self.stdout.write(content)
@@ -0,0 +1,27 @@
+from django.core.management import BaseCommand
+
+from identify.benchmarks import dump, environment, face
+from identify.lib.facebackends import FACE_BACKENDS
+
+
+class Command(BaseCommand):
+    help = '比较各个换脸后端的人脸检测和换脸耗时，结果输出为 JSON 。'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backends', type=lambda v: tuple(v.split(',')), default=tuple(FACE_BACKENDS),
+                            help=f'参与比较的后端，例如 {",".join(FACE_BACKENDS)}')
+        parser.add_argument('--images', help='人物照片所在的目录，为空时使用生成的图片')
+        parser.add_argument('--size', type=lambda v: tuple(int(n) for n in v.split('x')), default=face.DEFAULT_SIZE,
+                            help='生成图片的尺寸，例如 800x1000')
+        parser.add_argument('--iterations', type=int, default=10, help='每一项测试的次数')
+        parser.add_argument('--output', help='JSON 结果的保存位置，默认输出到终端')
+
+    def handle(self, *args, **options):
+        result = {
+            'environment': environment(),
+            'options': {k: options[k] for k in ('backends', 'images', 'size', 'iterations')},
+            **face.run(options['backends'], options['images'], options['iterations'], options['size']),
+        }
+        content = dump(result, options['output'])
+        if not options['output']:
+            self.stdout.write(content)
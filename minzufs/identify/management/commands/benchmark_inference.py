@@ -0,0 +1,37 @@
+from django.core.management import BaseCommand
+
+from identify.benchmarks import dump, environment, inference
+
+
+def _int_list(value):
+    return tuple(int(v) for v in value.split(','))
+
+
+def _size_list(value):
+    return tuple(tuple(int(v) for v in size.split('x')) for size in value.split(','))
+
+
+class Command(BaseCommand):
+    help = '测试识别流程各个阶段的性能，使用生成的图片离线运行，结果输出为 JSON 。'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=_size_list, default=inference.DEFAULT_SIZES,
+                            help='测试图片的尺寸，例如 640x480,4032x3024')
+        parser.add_argument('--formats', type=lambda v: tuple(v.upper().split(',')), default=inference.DEFAULT_FORMATS,
+                            help='测试图片的格式，例如 JPEG,PNG')
+        parser.add_argument('--batch-sizes', type=_int_list, default=(1, 4, 16), help='预测的批次大小，例如 1,4,16')
+        parser.add_argument('--threads', type=_int_list, default=(1, 4), help='并发预测的线程数量，例如 1,4')
+        parser.add_argument('--iterations', type=int, default=20, help='每一项测试的次数')
+        parser.add_argument('--skip-inference', action='store_true', help='只测试解码和预处理，不加载模型')
+        parser.add_argument('--output', help='JSON 结果的保存位置，默认输出到终端')
+
+    def handle(self, *args, **options):
+        result = {
+            'environment': environment(),
+            'options': {k: options[k] for k in ('sizes', 'formats', 'batch_sizes', 'threads', 'iterations')},
+            **inference.run(options['sizes'], options['formats'], options['batch_sizes'], options['threads'],
+                            options['iterations'], inference=not options['skip_inference']),
+        }
+        content = dump(result, options['output'])
+        if not options['output']:
+            self.stdout.write(content)
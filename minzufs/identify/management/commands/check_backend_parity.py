@@ -0,0 +1,71 @@
+import time
+from pathlib import Path
+
+import numpy as np
+from django.core.management import BaseCommand, CommandError
+
+from identify.backends import BACKENDS
+from identify.management.commands.classify_images import iter_images
+from identify.predict import get_model, label, label2, read_image, top_k
+
+# 目录名到类别编号的映射，目录名可以是中文名称或者英文名称
+_label_index = {**{name: i for i, name in label.items()}, **{name: i for i, name in label2.items()}}
+
+
+class Command(BaseCommand):
+    help = ('在留出的图片目录上比较两个推理后端的预测结果，检查导出的模型精度。'
+            '图片所在的目录名是类别名称（例如 save_miao 、 miao 或 苗族）时同时统计准确率。')
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='图片目录，会递归遍历子目录')
+        parser.add_argument('--backend', choices=list(BACKENDS), required=True, help='需要检查的后端')
+        parser.add_argument('--model-path', help='需要检查的模型文件，默认为该后端的默认模型')
+        parser.add_argument('--reference', choices=list(BACKENDS), default='keras', help='作为基准的后端')
+        parser.add_argument('--batch-size', type=int, default=16)
+        parser.add_argument('--limit', type=int, default=None, help='最多使用的图片数量')
+        parser.add_argument('--min-agreement', type=float, default=0.99, help='top-1 一致率低于该值时返回错误')
+
+    def handle(self, *args, **options):
+        paths = []
+        for path in iter_images(Path(options['directory'])):
+            paths.append(path)
+            if options['limit'] and len(paths) >= options['limit']:
+                break
+        if not paths:
+            raise CommandError('No images found.')
+
+        reference = get_model(backend=options['reference'])
+        candidate = get_model(options['model_path'], backend=options['backend'])
+        truths = [_label_index.get(Path(p).parent.name.replace('save_', ''), -1) for p in paths]
+
+        outputs = {'reference': [], 'candidate': []}
+        seconds = {'reference': 0.0, 'candidate': 0.0}
+        for start in range(0, len(paths), options['batch_size']):
+            batch = np.stack([read_image(p) for p in paths[start:start + options['batch_size']]])
+            for name, backend in (('reference', reference), ('candidate', candidate)):
+                begin = time.perf_counter()
+                outputs[name].append(backend.predict(batch))
+                seconds[name] += time.perf_counter() - begin
+        reference_out, candidate_out = np.concatenate(outputs['reference']), np.concatenate(outputs['candidate'])
+
+        reference_top, _ = top_k(reference_out, 3)
+        candidate_top, _ = top_k(candidate_out, 3)
+        top1 = float(np.mean(reference_top[:, 0] == candidate_top[:, 0]))
+        top3 = float(np.mean([set(a) == set(b) for a, b in zip(reference_top, candidate_top)]))
+        self.stdout.write(f'images: {len(paths)}')
+        self.stdout.write(f'top-1 agreement: {top1:.4f}')
+        self.stdout.write(f'top-3 set agreement: {top3:.4f}')
+        self.stdout.write(f'max abs probability diff: {float(np.max(np.abs(reference_out - candidate_out))):.6f}')
+        for name in ('reference', 'candidate'):
+            self.stdout.write(f'{name} inference: {seconds[name] / len(paths) * 1000:.2f}ms/image')
+
+        truths = np.array(truths)
+        labelled = truths >= 0
+        if labelled.any():
+            for name, top in (('reference', reference_top), ('candidate', candidate_top)):
+                accuracy = float(np.mean(top[labelled, 0] == truths[labelled]))
+                self.stdout.write(f'{name} accuracy on {int(labelled.sum())} labelled images: {accuracy:.4f}')
+
+        if top1 < options['min_agreement']:
+            raise CommandError(f'top-1 agreement {top1:.4f} is below {options["min_agreement"]}.')
+        self.stdout.write(self.style.SUCCESS('parity check passed'))
@@ -0,0 +1,182 @@
+import hashlib
+import os
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+
+from identify.metrics import StageTimer
+from identify.models import ImagesPost
+from identify.predict import forward, label, label2, model_version, read_image, top_k
+from identify.storage import store_sorted_image
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp'}
+
+
+def iter_images(directory: Path):
+    """逐个遍历目录（包括子目录）中的图片，不一次性列出全部文件。"""
+    stack = [directory]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS:
+                    yield entry.path
+
+
+def bounded_map(executor, fn, iterable, limit):
+    """
+    与 ``executor.map`` 相同，但同时最多只有 ``limit`` 个任务在执行或等待取走结果，
+    ``executor.map`` 会一次提交全部任务，解码结果堆积在内存中。
+    """
+    pending = deque()
+    for item in iterable:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= limit:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+# 子进程中已经识别过的图片内容，由 ``init_worker`` 设置
+_known = frozenset()
+
+
+def init_worker(known):
+    global _known
+    _known = frozenset(known)
+
+
+def decode(path):
+    """
+    在子进程中读取并预处理一张图片，先计算内容哈希，已经识别过的图片不再解码
+    :return: (路径, 内容哈希, 预处理后的图片, 错误信息, {阶段: 耗时}) ，跳过的图片没有预处理结果和错误信息
+    """
+    timer = StageTimer('recognition')
+    try:
+        with timer.stage('decode'):
+            with open(path, 'rb') as f:
+                content = f.read()
+            digest = hashlib.sha256(content).hexdigest()
+        if digest in _known:
+            return path, digest, None, None, timer.timings
+        return path, digest, read_image(content, timer), None, timer.timings
+    except Exception as e:
+        return path, None, None, str(e), timer.timings
+
+
+class Command(BaseCommand):
+    help = '批量识别目录中的图片并保存识别记录，已经识别过的图片（内容相同）会被跳过，中断后可以重新执行继续识别。'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='图片所在的目录，会递归遍历子目录')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='解码图片的进程数量')
+        parser.add_argument('--batch-size', type=int, default=getattr(settings, 'IDENTIFY_BATCH_MAX_SIZE', 16),
+                            help='一次预测的图片数量')
+        parser.add_argument('--move', action='store_true', help='识别记录写入数据库后删除原图，默认保留原图')
+
+    def handle(self, *args, **options):
+        directory = Path(options['directory'])
+        if not directory.is_dir():
+            raise CommandError(f'{directory} is not a directory.')
+        self.batch_size = max(1, options['batch_size'])
+        self.move = options['move']
+        self.version = model_version()
+        # 已经识别过的图片内容，用于断点续传和去重
+        self.known = set(ImagesPost.objects.filter(
+            content_hash__isnull=False, status=ImagesPost.STATUS_DONE, model_version=self.version,
+        ).values_list('content_hash', flat=True))
+        self.timings = defaultdict(float)
+        self.counts = defaultdict(int)
+
+        start = time.perf_counter()
+        batch = []
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=init_worker,
+                                 initargs=(self.known,)) as executor:
+            limit = options['workers'] * 4 + self.batch_size
+            for path, digest, image, error, timings in bounded_map(executor, decode, iter_images(directory), limit):
+                # 预处理在子进程中与解码一起完成，汇总时计入解码
+                self.timings['decode'] += sum(timings.values())
+                if error is not None:
+                    self.counts['failed'] += 1
+                    self.stderr.write(f'{path}: {error}')
+                    continue
+                if image is None or digest in self.known:
+                    self.counts['skipped'] += 1
+                    continue
+                self.known.add(digest)
+                timer = StageTimer('recognition')
+                for name, seconds in timings.items():
+                    timer.add(name, seconds)
+                batch.append((path, digest, image, timer))
+                if len(batch) >= self.batch_size:
+                    self.flush(batch)
+                    batch = []
+            self.flush(batch)
+        self.report(time.perf_counter() - start)
+
+    def flush(self, batch):
+        """
+        预测一个批次并保存识别记录。每张图片单独记录解码、预处理和存储的耗时，
+        推理和数据库是整个批次一起完成的，按图片数量平均分摊。
+        """
+        if not batch:
+            return
+        paths, digests, images, timers = zip(*batch)
+
+        start = time.perf_counter()
+        indices, probabilities = top_k(forward(np.stack(images)), 3)
+        inference = time.perf_counter() - start
+        self.timings['inference'] += inference
+
+        # 先复制到归类目录并写入数据库，提交之后才删除原图；中途中断时原图仍在，重新执行即可继续
+        posts = []
+        for path, digest, result, confidences, timer in zip(paths, digests, indices, probabilities, timers):
+            timer.add('inference', inference / len(batch))
+            with timer.stage('storage'):
+                dst = store_sorted_image(path, label2[result[0]], None, digest, copy=True)
+            self.timings['storage'] += timer.get('storage')
+            posts.append(ImagesPost(
+                upload_images=os.path.relpath(dst, settings.MEDIA_ROOT),
+                nation1=label[result[0]], nation2=label[result[1]], nation3=label[result[2]],
+                confidence1=float(confidences[0]), confidence2=float(confidences[1]),
+                confidence3=float(confidences[2]),
+                time_consuming=round(sum(timer.timings.values()), 2),
+                status=ImagesPost.STATUS_DONE, content_hash=digest, model_version=self.version,
+                **{f'{name}_seconds': timer.get(name) for name in ('decode', 'preprocess', 'inference', 'storage')},
+            ))
+
+        with transaction.atomic():
+            start = time.perf_counter()
+            ImagesPost.objects.bulk_create(posts)
+            db = time.perf_counter() - start
+            # 数据库阶段的耗时在写入之后才能得到，在同一个事务里单独更新这一个字段
+            ImagesPost.objects.filter(upload_images__in=[post.upload_images.name for post in posts]).update(
+                db_seconds=db / len(posts))
+        self.timings['db'] += db
+        self.counts['classified'] += len(posts)
+        for timer in timers:
+            timer.add('db', db / len(posts))
+            timer.observe()
+
+        if self.move:
+            start = time.perf_counter()
+            for path in paths:
+                os.remove(path)
+            self.timings['storage'] += time.perf_counter() - start
+
+    def report(self, elapsed):
+        classified = self.counts['classified']
+        self.stdout.write(
+            f'classified {classified}, skipped {self.counts["skipped"]}, failed {self.counts["failed"]} '
+            f'in {elapsed:.2f}s ({classified / elapsed if elapsed else 0:.2f} images/sec)')
+        for stage in ('decode', 'inference', 'storage', 'db'):
+            per_image = self.timings[stage] / classified * 1000 if classified else 0
+            self.stdout.write(f'  {stage:<10} {self.timings[stage]:10.3f}s  {per_image:8.2f}ms/image')
+        self.stdout.write(self.style.SUCCESS('done'))
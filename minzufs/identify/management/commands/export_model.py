@@ -0,0 +1,83 @@
+from pathlib import Path
+
+from django.core.management import BaseCommand, CommandError
+
+from identify.backends import MODEL_FILE_NAMES, normalize
+from identify.management.commands.classify_images import iter_images
+from identify.predict import CHANNELS, COLS, ROWS, default_model_path, read_image
+
+
+class Command(BaseCommand):
+    help = '把 Keras 模型导出为 ONNX 或 TFLite ，可以选择 int8 量化，导出后使用 check_backend_parity 检查精度。'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', nargs='+', choices=['onnx', 'tflite'], default=['onnx'], help='导出的格式')
+        parser.add_argument('--int8', action='store_true', help='同时导出 int8 量化的模型')
+        parser.add_argument('--calibration-dir',
+                            help='TFLite 完全 int8 量化时用于校准的图片目录，不指定时只量化权重')
+        parser.add_argument('--calibration-size', type=int, default=200, help='最多使用的校准图片数量')
+        parser.add_argument('--source', default=None, help='Keras 模型文件，默认为 trained_model 下的 h5 文件')
+        parser.add_argument('--output-dir', default=None, help='输出目录，默认与 Keras 模型相同')
+        parser.add_argument('--opset', type=int, default=13, help='ONNX 的 opset 版本')
+
+    def handle(self, *args, **options):
+        import tensorflow as tf
+
+        source = Path(options['source'] or default_model_path('keras'))
+        if not source.exists():
+            raise CommandError(f'{source} does not exist.')
+        output_dir = Path(options['output_dir'] or source.parent)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        model = tf.keras.models.load_model(str(source), compile=False)
+
+        if 'onnx' in options['format']:
+            self.export_onnx(model, output_dir / MODEL_FILE_NAMES['onnx'], options)
+        if 'tflite' in options['format']:
+            self.export_tflite(model, output_dir / MODEL_FILE_NAMES['tflite'], options)
+
+    def export_onnx(self, model, path: Path, options):
+        import tensorflow as tf
+        import tf2onnx
+
+        spec = (tf.TensorSpec((None, ROWS, COLS, CHANNELS), tf.float32, name='input'),)
+        tf2onnx.convert.from_keras(model, input_signature=spec, opset=options['opset'], output_path=str(path))
+        self.stdout.write(self.style.SUCCESS(f'exported {path}'))
+        if options['int8']:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+
+            int8_path = path.with_name(f'{path.stem}-int8{path.suffix}')
+            quantize_dynamic(str(path), str(int8_path), weight_type=QuantType.QInt8)
+            self.stdout.write(self.style.SUCCESS(f'exported {int8_path}'))
+
+    def export_tflite(self, model, path: Path, options):
+        import tensorflow as tf
+
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+        path.write_bytes(converter.convert())
+        self.stdout.write(self.style.SUCCESS(f'exported {path}'))
+        if not options['int8']:
+            return
+
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        if options['calibration_dir']:
+            # 使用真实图片校准激活值的范围，输入输出也量化为 int8
+            paths = []
+            for image_path in iter_images(Path(options['calibration_dir'])):
+                paths.append(image_path)
+                if len(paths) >= options['calibration_size']:
+                    break
+            if not paths:
+                raise CommandError(f'No images found in {options["calibration_dir"]}.')
+
+            def representative_dataset():
+                for image_path in paths:
+                    yield [normalize(read_image(image_path)[None])]
+
+            converter.representative_dataset = representative_dataset
+            converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+            converter.inference_input_type = tf.int8
+            converter.inference_output_type = tf.int8
+        int8_path = path.with_name(f'{path.stem}-int8{path.suffix}')
+        int8_path.write_bytes(converter.convert())
+        self.stdout.write(self.style.SUCCESS(f'exported {int8_path}'))
@@ -0,0 +1,24 @@
+from django.core.management import BaseCommand
+
+from identify.lib.facepp_mock import make_server
+
+
+class Command(BaseCommand):
+    help = '启动本地的 Face++ 替身服务，把 FACEPP_API_BASE 指向它即可离线压测合成流程。'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', type=float, default=0.0, help='每个请求额外等待的秒数，模拟云端接口')
+        parser.add_argument('--concurrency-limit', type=int, default=None,
+                            help='同时处理的请求数量上限，超出时返回 403 CONCURRENCY_LIMIT_EXCEEDED')
+
+    def handle(self, *args, **options):
+        server = make_server(options['host'], options['port'], options['latency'], options['concurrency_limit'])
+        self.stdout.write(f'Face++ mock server listening on http://{options["host"]}:{options["port"]}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
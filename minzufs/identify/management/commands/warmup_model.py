@@ -0,0 +1,13 @@
+from django.core.management import BaseCommand, CommandError
+
+from identify.health import readiness
+
+
+class Command(BaseCommand):
+    help = '加载识别模型并对配置的批次大小各做一次预测，用于检查模型是否可用以及预热耗时。'
+
+    def handle(self, *args, **options):
+        readiness.warm_up()
+        if readiness.state != readiness.READY:
+            raise CommandError(f'warm-up failed: {readiness.error}')
+        self.stdout.write(self.style.SUCCESS(f'warm-up finished in {readiness.duration:.2f}s'))
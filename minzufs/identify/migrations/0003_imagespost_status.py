@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-19 04:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('identify', '0002_auto_20220412_2140'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagespost',
+            name='error_message',
+            field=models.TextField(blank=True, default=None, null=True, verbose_name='错误信息'),
+        ),
+        migrations.AddField(
+            model_name='imagespost',
+            name='status',
+            field=models.CharField(choices=[('pending', '等待识别'), ('running', '正在识别'), ('done', '识别完成'), ('failed', '识别失败')], default='done', max_length=20, verbose_name='识别状态'),
+        ),
+    ]
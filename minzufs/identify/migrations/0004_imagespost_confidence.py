@@ -0,0 +1,28 @@
+# Generated by Django 2.2.28 on 2026-10-19 04:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('identify', '0003_imagespost_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagespost',
+            name='confidence1',
+            field=models.FloatField(blank=True, null=True, verbose_name='置信度1'),
+        ),
+        migrations.AddField(
+            model_name='imagespost',
+            name='confidence2',
+            field=models.FloatField(blank=True, null=True, verbose_name='置信度2'),
+        ),
+        migrations.AddField(
+            model_name='imagespost',
+            name='confidence3',
+            field=models.FloatField(blank=True, null=True, verbose_name='置信度3'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-19 04:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('identify', '0004_imagespost_confidence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagespost',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, default=None, max_length=64, null=True, verbose_name='内容哈希'),
+        ),
+        migrations.AddField(
+            model_name='imagespost',
+            name='model_version',
+            field=models.CharField(blank=True, default=None, max_length=64, null=True, verbose_name='模型版本'),
+        ),
+    ]
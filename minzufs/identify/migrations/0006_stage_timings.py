@@ -0,0 +1,63 @@
+# Generated by Django 2.2.28 on 2026-10-19 04:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('identify', '0005_imagespost_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagespost',
+            name='db_seconds',
+            field=models.FloatField(blank=True, null=True, verbose_name='数据库耗时'),
+        ),
+        migrations.AddField(
+            model_name='imagespost',
+            name='decode_seconds',
+            field=models.FloatField(blank=True, null=True, verbose_name='解码耗时'),
+        ),
+        migrations.AddField(
+            model_name='imagespost',
+            name='inference_seconds',
+            field=models.FloatField(blank=True, null=True, verbose_name='推理耗时'),
+        ),
+        migrations.AddField(
+            model_name='imagespost',
+            name='preprocess_seconds',
+            field=models.FloatField(blank=True, null=True, verbose_name='预处理耗时'),
+        ),
+        migrations.AddField(
+            model_name='imagespost',
+            name='storage_seconds',
+            field=models.FloatField(blank=True, null=True, verbose_name='存储耗时'),
+        ),
+        migrations.AddField(
+            model_name='mergedimagemodel',
+            name='blending_seconds',
+            field=models.FloatField(blank=True, null=True, verbose_name='合成耗时'),
+        ),
+        migrations.AddField(
+            model_name='mergedimagemodel',
+            name='encoding_seconds',
+            field=models.FloatField(blank=True, null=True, verbose_name='编码耗时'),
+        ),
+        migrations.AddField(
+            model_name='mergedimagemodel',
+            name='face_detection_seconds',
+            field=models.FloatField(blank=True, null=True, verbose_name='人脸检测耗时'),
+        ),
+        migrations.AddField(
+            model_name='mergedimagemodel',
+            name='face_swap_seconds',
+            field=models.FloatField(blank=True, null=True, verbose_name='换脸耗时'),
+        ),
+        migrations.AddField(
+            model_name='mergedimagemodel',
+            name='segmentation_seconds',
+            field=models.FloatField(blank=True, null=True, verbose_name='人像分割耗时'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-19 05:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('identify', '0006_stage_timings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mergedimagemodel',
+            name='error_message',
+            field=models.TextField(blank=True, default=None, null=True, verbose_name='错误信息'),
+        ),
+        migrations.AddField(
+            model_name='mergedimagemodel',
+            name='status',
+            field=models.CharField(blank=True, choices=[('queued', '排队中'), ('face-swap', '正在换脸'), ('segmenting', '正在分割人像'), ('blending', '正在合成'), ('done', '合成完成'), ('failed', '合成失败')], default=None, max_length=20, null=True, verbose_name='合成状态'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 2.2.5 on 2026-10-19 05:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('identify', '0007_mergedimagemodel_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FaceDetection',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64, verbose_name='图片哈希')),
+                ('backend', models.CharField(max_length=32, verbose_name='检测后端')),
+                ('top', models.IntegerField()),
+                ('left', models.IntegerField()),
+                ('width', models.IntegerField()),
+                ('height', models.IntegerField()),
+                ('landmarks', models.TextField(blank=True, default=None, null=True, verbose_name='人脸关键点')),
+                ('last_used', models.DateTimeField(auto_now=True, db_index=True, verbose_name='最近使用时间')),
+            ],
+            options={
+                'verbose_name': '人脸检测缓存',
+                'verbose_name_plural': '人脸检测缓存',
+                'unique_together': {('content_hash', 'backend')},
+            },
+        ),
+    ]
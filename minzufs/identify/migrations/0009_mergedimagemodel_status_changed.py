@@ -0,0 +1,18 @@
+# Generated by Django 2.2.5 on 2026-10-19 05:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('identify', '0008_facedetection'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mergedimagemodel',
+            name='status_changed',
+            field=models.DateTimeField(blank=True, default=None, null=True, verbose_name='状态更新时间'),
+        ),
+    ]
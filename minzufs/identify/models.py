@@ -1,11 +1,14 @@
 import os.path
-import tempfile
+from datetime import timedelta
 from pathlib import Path
 
 from django.conf import settings
+from django.core.files.base import ContentFile
 from django.db import models
+from django.utils import timezone
 
 from identify import lib
+from identify.metrics import StageTimer
 from users.models import UserProfile
 
 
@@ -18,12 +21,39 @@ class ImagesPost(models.Model):
     user = models.ForeignKey(to=UserProfile, on_delete=models.CASCADE, related_name='images_posted',
                              null=True, blank=True, default=None)
 
+    STATUS_PENDING, STATUS_RUNNING, STATUS_DONE, STATUS_FAILED = 'pending', 'running', 'done', 'failed'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, '等待识别'),
+        (STATUS_RUNNING, '正在识别'),
+        (STATUS_DONE, '识别完成'),
+        (STATUS_FAILED, '识别失败'),
+    )
+
     upload_images = models.ImageField(upload_to='upload_images')  # 应该用单数
     nation1 = models.CharField(max_length=20, null=True, blank=True)
     nation2 = models.CharField(max_length=20, null=True, blank=True)
     nation3 = models.CharField(max_length=20, null=True, blank=True)
+    # 三个识别结果对应的概率
+    confidence1 = models.FloatField(verbose_name='置信度1', null=True, blank=True)
+    confidence2 = models.FloatField(verbose_name='置信度2', null=True, blank=True)
+    confidence3 = models.FloatField(verbose_name='置信度3', null=True, blank=True)
     modified_nation = models.CharField(max_length=20, null=True, blank=True)
     time_consuming = models.CharField(max_length=50, null=True, blank=True)
+    # 异步识别时，前端通过这个字段轮询识别进度
+    status = models.CharField(verbose_name='识别状态', max_length=20, choices=STATUS_CHOICES, default=STATUS_DONE)
+    error_message = models.TextField(verbose_name='错误信息', null=True, blank=True, default=None)
+    # 最近一次更新识别状态的时间，用于判断后台任务是否已经随进程重启丢失
+    status_changed = models.DateTimeField(verbose_name='状态更新时间', null=True, blank=True, default=None)
+    # 图片内容的哈希以及识别时使用的模型版本，相同内容的图片直接复用识别结果
+    content_hash = models.CharField(
+        verbose_name='内容哈希', max_length=64, null=True, blank=True, default=None, db_index=True)
+    model_version = models.CharField(verbose_name='模型版本', max_length=64, null=True, blank=True, default=None)
+    # 各阶段的耗时（秒）
+    decode_seconds = models.FloatField(verbose_name='解码耗时', null=True, blank=True)
+    preprocess_seconds = models.FloatField(verbose_name='预处理耗时', null=True, blank=True)
+    inference_seconds = models.FloatField(verbose_name='推理耗时', null=True, blank=True)
+    storage_seconds = models.FloatField(verbose_name='存储耗时', null=True, blank=True)
+    db_seconds = models.FloatField(verbose_name='数据库耗时', null=True, blank=True)
 
     # 以下为用户意见提交，无需展示到界面
     user_assess = models.CharField(max_length=50, null=True, blank=True, default='未填写')  # 用户满意程度
@@ -50,6 +80,90 @@ class ImagesPost(models.Model):
         # return self.title 将文章标题返回  __str__魔法方法，自己定义 输出打印对象时候的返回值
         return f'{self.id}'
 
+    def set_status(self, status, error_message=None):
+        """只更新状态字段，识别过程中不会覆盖其他字段。"""
+        self.status, self.error_message, self.status_changed = status, error_message, timezone.now()
+        ImagesPost.objects.filter(pk=self.pk).update(
+            status=status, error_message=error_message, status_changed=self.status_changed)
+
+    @property
+    def is_stale(self) -> bool:
+        """
+        是否停在了等待识别或正在识别的状态。任务只保存在进程内，进程重启后状态不会再更新，
+        超过 ``settings.IDENTIFY_JOB_STALE_SECONDS`` 没有更新的状态视为已经丢失。
+        """
+        if self.status not in (self.STATUS_PENDING, self.STATUS_RUNNING):
+            return False
+        stale = timedelta(seconds=getattr(settings, 'IDENTIFY_JOB_STALE_SECONDS', 600))
+        return timezone.now() - (self.status_changed or self.created) >= stale
+
+    def fail_if_stale(self) -> bool:
+        """已经丢失的识别任务记为识别失败，返回是否做了修改。"""
+        if not self.is_stale:
+            return False
+        self.set_status(self.STATUS_FAILED, 'The identification job was lost before it finished.')
+        return True
+
+    def requeue(self) -> bool:
+        """
+        把识别失败的记录重新置为等待识别，只有一个请求能够成功，返回是否需要提交新的识别任务。
+        """
+        now = timezone.now()
+        updated = ImagesPost.objects.filter(pk=self.pk, status=self.STATUS_FAILED).update(
+            status=self.STATUS_PENDING, error_message=None, status_changed=now)
+        if updated:
+            self.status, self.error_message, self.status_changed = self.STATUS_PENDING, None, now
+        return bool(updated)
+
+    def identify(self):
+        """识别上传的图片，失败时记录错误信息并重新抛出异常。"""
+        self.set_status(self.STATUS_RUNNING)
+        try:
+            self._identify()
+        except Exception as e:
+            self.set_status(self.STATUS_FAILED, str(e))
+            raise
+
+    def _identify(self):
+        """识别上传的图片，将图片归类保存，并记录识别结果。"""
+        from .predict import model_version
+        from .rename import BatchRename
+        from .resultcache import result_cache
+        from .uploadhandlers import file_sha256
+
+        timer = StageTimer('recognition')
+        if not self.content_hash:
+            self.content_hash = file_sha256(self.upload_images)
+        version = model_version()
+        with timer.stage('db'):
+            cached = result_cache.lookup(self.content_hash, version, exclude_pk=self.pk)
+        # 实例化重命名BatchRename()模块  只识别本次上传的图片
+        batch_rename = BatchRename(self.upload_images.path, self.pk, self.content_hash)
+        # 提取相应的返回值
+        nations, confidences, dst, time_consuming = batch_rename.rename(cached, timer)
+        if cached is None:
+            # 记录实际完成识别的模型的版本
+            version = model_version()
+        self.model_version = version
+        # dst：图片重新分类后保存的路径  new_url 截取的相对路径
+        self.upload_images = os.path.relpath(dst, settings.MEDIA_ROOT)
+        # 类别及其概率
+        self.nation1, self.nation2, self.nation3 = nations
+        self.confidence1, self.confidence2, self.confidence3 = confidences
+        self.time_consuming = time_consuming  # 耗费的时间
+        self.status = self.STATUS_DONE
+        self.error_message = None
+        for name in ('decode', 'preprocess', 'inference', 'storage'):
+            setattr(self, f'{name}_seconds', timer.get(name))
+        with timer.stage('db'):
+            self.save()
+        # 数据库阶段的耗时在保存之后才能得到，单独更新这一个字段
+        self.db_seconds = timer.get('db')
+        ImagesPost.objects.filter(pk=self.pk).update(db_seconds=self.db_seconds)
+        timer.observe()
+        if cached is None and version:
+            result_cache.set(self.content_hash, version, batch_rename.result)
+
 
 def _merge_image_person_1_head_image_path(instance: 'MergedImageModel', filename: str):
     ext = os.path.splitext(filename)[1]
@@ -78,6 +192,21 @@ class MergedImageModel(models.Model):
         verbose_name = '图像合成'
         verbose_name_plural = verbose_name
 
+    STATUS_QUEUED, STATUS_FACE_SWAP, STATUS_SEGMENTING, STATUS_BLENDING = 'queued', 'face-swap', 'segmenting', 'blending'
+    STATUS_DONE, STATUS_FAILED = 'done', 'failed'
+    STATUS_CHOICES = (
+        (STATUS_QUEUED, '排队中'),
+        (STATUS_FACE_SWAP, '正在换脸'),
+        (STATUS_SEGMENTING, '正在分割人像'),
+        (STATUS_BLENDING, '正在合成'),
+        (STATUS_DONE, '合成完成'),
+        (STATUS_FAILED, '合成失败'),
+    )
+    # 排队或者正在合成的状态
+    STATUS_IN_PROGRESS = (STATUS_QUEUED, STATUS_FACE_SWAP, STATUS_SEGMENTING, STATUS_BLENDING)
+    # 记录耗时的合成阶段，对应 ``<阶段>_seconds`` 字段
+    TIMED_STAGES = ('face_detection', 'face_swap', 'segmentation', 'blending', 'encoding')
+
     user = models.ForeignKey(
         verbose_name='用户', to=UserProfile, on_delete=models.PROTECT, null=True, blank=True, default=None)
     person_1_identification = models.ForeignKey(
@@ -94,6 +223,18 @@ class MergedImageModel(models.Model):
         verbose_name='背景名称', max_length=100, null=True, blank=True, default=None)
     result_image = models.ImageField(
         verbose_name='合成后的图片', upload_to=_merge_image_person_merged_path, null=True, blank=True, default=None)
+    # 合成进度，前端轮询详情接口获取；从未合成过时为空
+    status = models.CharField(
+        verbose_name='合成状态', max_length=20, choices=STATUS_CHOICES, null=True, blank=True, default=None)
+    error_message = models.TextField(verbose_name='错误信息', null=True, blank=True, default=None)
+    # 最近一次更新合成状态的时间，用于判断后台任务是否已经随进程重启丢失
+    status_changed = models.DateTimeField(verbose_name='状态更新时间', null=True, blank=True, default=None)
+    # 各阶段的耗时（秒）
+    face_detection_seconds = models.FloatField(verbose_name='人脸检测耗时', null=True, blank=True)
+    face_swap_seconds = models.FloatField(verbose_name='换脸耗时', null=True, blank=True)
+    segmentation_seconds = models.FloatField(verbose_name='人像分割耗时', null=True, blank=True)
+    blending_seconds = models.FloatField(verbose_name='合成耗时', null=True, blank=True)
+    encoding_seconds = models.FloatField(verbose_name='编码耗时', null=True, blank=True)
 
     def save(self, *args, **kwargs):
         if not self.id:
@@ -104,22 +245,130 @@ class MergedImageModel(models.Model):
             kwargs.get('force_insert', False) is True and kwargs.pop('force_insert')
         super().save(*args, **kwargs)
 
+    def set_status(self, status, error_message=None):
+        """只更新状态字段，合成过程中不会覆盖其他字段。"""
+        self.status, self.error_message, self.status_changed = status, error_message, timezone.now()
+        MergedImageModel.objects.filter(pk=self.pk).update(
+            status=status, error_message=error_message, status_changed=self.status_changed)
+
+    @staticmethod
+    def _stale_after() -> timedelta:
+        return timedelta(seconds=getattr(settings, 'IDENTIFY_MERGE_STALE_SECONDS', 600))
+
+    @property
+    def is_merging(self) -> bool:
+        """
+        是否正在排队或者合成。任务只保存在进程内，进程重启后状态会停在中间，
+        超过 ``settings.IDENTIFY_MERGE_STALE_SECONDS`` 没有更新的状态视为已经丢失。
+        """
+        if self.status not in self.STATUS_IN_PROGRESS:
+            return False
+        return self.status_changed is not None and timezone.now() - self.status_changed < self._stale_after()
+
+    def queue(self) -> bool:
+        """
+        把本对象置为排队中。判断和修改在同一条 UPDATE 中完成，同时到达的多个请求只有一个能够成功，
+        正在合成且没有过期的对象不会重复排队。
+        :return: 是否成功排队，成功时需要提交新的合成任务
+        """
+        now = timezone.now()
+        updated = MergedImageModel.objects.filter(pk=self.pk).exclude(
+            status__in=self.STATUS_IN_PROGRESS, status_changed__gt=now - self._stale_after(),
+        ).update(status=self.STATUS_QUEUED, error_message=None, status_changed=now)
+        if updated:
+            self.status, self.error_message, self.status_changed = self.STATUS_QUEUED, None, now
+        return bool(updated)
+
     def merge(self):
-        """执行图像的合并过程。"""
+        """执行图像的合并过程，失败时记录错误信息并重新抛出异常。"""
+        try:
+            self._merge()
+        except Exception as e:
+            self.set_status(self.STATUS_FAILED, str(e))
+            raise
+
+    def _merge_inputs(self, background_names):
+        """检查合成需要的图片和背景，返回 (服饰1, 头像1, 服饰2, 头像2) 的路径。"""
         head1, head2 = self.person_1_head_image.path, self.person_2_head_image.path
         clothes1, clothes2 = self.person_1_identification.upload_images.path, self.person_2_identification.upload_images.path
-        background = self.background_name
         if not all((
                 Path(head1).exists(), Path(head2).exists(), Path(clothes1).exists(), Path(clothes2).exists(),
-                background in lib.mergeimages.BACKGROUND_LIST,
+                *(background in lib.backgrounds.BACKGROUND_LIST for background in background_names),
         )):
             raise ValueError(f'The image {self.id} is not available to merge now.')
-        content = lib.merge_images(clothes1, head1, clothes2, head2, background)
+        return clothes1, head1, clothes2, head2
+
+    def _merge(self):
+        background = self.background_name
+        clothes1, head1, clothes2, head2 = self._merge_inputs([background])
+        timer = StageTimer('merge')
+        content = lib.merge_images(clothes1, head1, clothes2, head2, background, timer, progress=self.set_status)
+        for name in self.TIMED_STAGES:
+            setattr(self, f'{name}_seconds', timer.get(name))
         # try:
         #     content = lib.merge_images(clothes1, head1, clothes2, head2, background)
         # except:
         #     with open(lib.mergeimages.BACKGROUND_LIST[background], 'rb') as f:
         #         content = f.read()
-        with tempfile.TemporaryFile('r+b') as f:
-            f.write(content)
-            self.result_image.save(f'image.png', f)
+        with timer.stage('storage'):
+            self.result_image.save('image.png', ContentFile(content), save=False)
+            # 只保存合成结果和耗时，合成期间通过接口修改的其他字段（例如背景）不会被覆盖
+            self.save(update_fields=['result_image', *(f'{name}_seconds' for name in self.TIMED_STAGES)])
+        self.set_status(self.STATUS_DONE)
+        timer.observe()
+
+    def render_all(self, background_names=None):
+        """
+        把这一对人像合成到多个背景上，换脸和分割只做一次，不修改本对象的合成结果
+        :param background_names: 背景名称的列表，为空时使用全部背景
+        :return: {背景名称: 图片相对于 MEDIA_ROOT 的路径}
+        """
+        background_names = list(background_names or lib.backgrounds.BACKGROUND_LIST)
+        inputs = self._merge_inputs(background_names)
+        timer = StageTimer('render-all')
+        contents = lib.render_backgrounds(*inputs, background_names, timer)
+        storage, names = self.result_image.storage, {}
+        with timer.stage('storage'):
+            for background, content in contents.items():
+                name = f'merge-image/merged-{self.id}-{background}.png'
+                # 重新生成时覆盖旧的文件，而不是另存为新的名称
+                storage.delete(name)
+                names[background] = storage.save(name, ContentFile(content))
+        timer.observe()
+        return names
+
+    def render_contact_sheet(self, background_names=None) -> bytes:
+        """把这一对人像合成到多个背景上，排列成一张 PNG 预览图。"""
+        background_names = list(background_names or lib.backgrounds.BACKGROUND_LIST)
+        inputs = self._merge_inputs(background_names)
+        timer = StageTimer('render-all')
+        images = lib.render_backgrounds(*inputs, background_names, timer, encode=False)
+        with timer.stage('encoding'):
+            content = lib.mergeimages.encode_png(lib.mergeimages.contact_sheet(images))
+        timer.observe()
+        return content
+
+
+class FaceDetection(models.Model):
+    """
+    人脸检测结果的缓存，以图片内容的 SHA-256 和检测后端为键。
+    同一张服饰图片、头像图片再次参与合成时不需要重新检测人脸。
+    """
+
+    class Meta:
+        verbose_name = '人脸检测缓存'
+        verbose_name_plural = verbose_name
+        unique_together = ('content_hash', 'backend')
+
+    content_hash = models.CharField(verbose_name='图片哈希', max_length=64)
+    backend = models.CharField(verbose_name='检测后端', max_length=32)
+    top = models.IntegerField()
+    left = models.IntegerField()
+    width = models.IntegerField()
+    height = models.IntegerField()
+    # 关键点坐标的 JSON ，后端没有返回关键点时为空
+    landmarks = models.TextField(verbose_name='人脸关键点', null=True, blank=True, default=None)
+    last_used = models.DateTimeField(verbose_name='最近使用时间', auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f'{self.backend}:{self.content_hash[:12]}'
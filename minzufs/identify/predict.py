@@ -1,12 +1,16 @@
-import os
+import hashlib
+import io
+import threading
 from pathlib import Path
 
 import cv2
 import numpy as np
-from PIL import Image
+from PIL import Image, ImageOps
 from django.conf import settings
-from tensorflow.keras.backend import clear_session
-from tensorflow.keras.models import load_model
+
+from .backends import MODEL_FILE_NAMES, create_backend
+from .batching import get_scheduler
+from .metrics import stage
 
 ROWS = 224
 COLS = 224
@@ -25,36 +29,199 @@ label2 = {
 }
 
 
-def read_image(file_path):
-    path = Path(file_path)
-    img = np.array(Image.open(path))
-    img = img[:, :, [2, 1, 0]]
-    return cv2.resize(img, (ROWS, COLS), interpolation=cv2.INTER_CUBIC)
-
-
-def predict():
-    test_dir = './media/upload_images/'
-    clear_session()  # 清理浏览器的session对象
-    model_dir = Path(settings.BASE_DIR) / 'trained_model'
-    model_dir.mkdir(exist_ok=True, parents=True)
-    model_path = str(model_dir / 'Dense2018983.h5')
-    model = load_model(model_path, compile=False)
-    test_images = [test_dir + i for i in os.listdir(test_dir)]  # 列表生成式，逐个字母生成路径  os.listdir输出path下的各种文件
-    count = len(test_images)
-    data = np.ndarray((count, ROWS, COLS, CHANNELS), dtype=np.uint8)  # data-type 数组中元素的类型
-    for i, image_file in enumerate(test_images):
-        # 获取测试图片文件，并进行处理enumerate() 函数用于将一个可遍历的数据对象(如列表、元组或字符串)组合为一个索引序列，同时列出数据和数据下标，一般用在 for 循环当中。
-        image = read_image(image_file)
-        data[i] = image
-    test = data
+def default_backend() -> str:
+    """推理后端的名称，由 ``settings.IDENTIFY_INFERENCE_BACKEND`` 指定，默认为 ``keras`` 。"""
+    return getattr(settings, 'IDENTIFY_INFERENCE_BACKEND', None) or 'keras'
+
+
+def default_model_path(backend=None) -> Path:
+    """分类模型的默认位置，可以通过 ``settings.IDENTIFY_MODEL_PATH`` 覆盖。"""
+    model_path = getattr(settings, 'IDENTIFY_MODEL_PATH', None)
+    if model_path and backend is None:
+        return Path(model_path)
+    return Path(settings.BASE_DIR) / 'trained_model' / MODEL_FILE_NAMES[backend or default_backend()]
+
+
+def file_version(model_path):
+    """根据模型文件的大小和修改时间生成版本，模型文件不存在时返回 None 。"""
+    model_path = Path(model_path)
+    if not model_path.exists():
+        return None
+    stat = model_path.stat()
+    key = f'{model_path.name}:{stat.st_size}:{stat.st_mtime_ns}'
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+def model_version(model_path=None, backend=None):
+    """
+    当前模型的版本，用于判断缓存的识别结果是否仍然有效。
+    优先使用 ``settings.IDENTIFY_MODEL_VERSION`` ；否则模型已经加载时返回加载时记录的版本，
+    模型文件在运行期间被替换也不会变化；还没有加载时根据模型文件生成。
+    """
+    version = getattr(settings, 'IDENTIFY_MODEL_VERSION', None)
+    if version:
+        return str(version)
+    return model_registry.version(model_path, backend)
+
+
+class ModelRegistry:
+    """
+    进程内的模型注册表。
+
+    每个模型文件在一个进程里只加载一次，之后所有请求都复用常驻内存的模型，
+    避免每次识别都重新解析 HDF5 并构建计算图。加载过程加锁，多线程的 worker 同时请求时也只会加载一次。
+    """
+
+    def __init__(self):
+        self._models = {}
+        self._versions = {}  # 加载时模型文件的版本
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(model_path=None, backend=None):
+        backend = backend or default_backend()
+        return backend, str(model_path or default_model_path(None if backend == default_backend() else backend))
+
+    def get(self, model_path=None, backend=None):
+        """
+        获取推理后端
+        :param model_path: 模型文件，默认为 ``default_model_path()``
+        :param backend: 后端名称，默认为 ``default_backend()``
+        """
+        key = self._key(model_path, backend)
+        model = self._models.get(key)
+        if model is not None:
+            return model
+        with self._lock:
+            # 双重检查，等待锁的线程不会重复加载
+            model = self._models.get(key)
+            if model is None:
+                Path(key[1]).parent.mkdir(exist_ok=True, parents=True)
+                # 在读取文件之前记录版本，加载期间文件被替换时版本只会偏旧，下次重新加载后更正
+                version = file_version(key[1])
+                model = self._models[key] = create_backend(*key)
+                self._versions[key] = version
+        return model
+
+    def version(self, model_path=None, backend=None):
+        """已经加载的模型在加载时的版本，还没有加载时根据模型文件生成。"""
+        key = self._key(model_path, backend)
+        if key in self._versions:
+            return self._versions[key]
+        return file_version(key[1])
+
+    def is_loaded(self, model_path=None, backend=None) -> bool:
+        return self._key(model_path, backend) in self._models
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+            self._versions.clear()
+
+
+model_registry = ModelRegistry()
+
+
+def get_model(model_path=None, backend=None):
+    """获取常驻内存的分类模型（推理后端）。"""
+    return model_registry.get(model_path, backend)
+
+
+def open_image(source) -> Image.Image:
+    """
+    打开一张图片
+    :param source: 图片路径、二进制数据或者文件对象（例如 ``ImagesPost.upload_images``）
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return Image.open(io.BytesIO(source))
+    if hasattr(source, 'read'):
+        hasattr(source, 'seek') and source.seek(0)
+        return Image.open(source)
+    return Image.open(Path(source))
+
+
+def read_image(source, timer=None):
+    """
+    读取图片并预处理为模型的输入
+    :param source: 图片路径、二进制数据或者文件对象
+    :param timer: ``StageTimer`` ，分别记录 decode 和 preprocess 两个阶段的耗时
+    :return: 形如 (ROWS, COLS, 3) 的 BGR 图片
+    """
+    with stage(timer, 'decode'):
+        img = open_image(source)
+        # JPEG 在解码时可以直接按 1/2、1/4、1/8 缩小，只解码到不小于目标大小的分辨率，手机拍摄的大图不再完整解码
+        img.draft('RGB', (COLS, ROWS))
+        img.load()
+    with stage(timer, 'preprocess'):
+        # 按照 EXIF 中的方向信息旋转图片
+        img = ImageOps.exif_transpose(img)
+        # 灰度图、带透明通道的图片等统一转换为 RGB
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        img = cv2.resize(np.asarray(img), (COLS, ROWS), interpolation=cv2.INTER_CUBIC)
+        # 缩小之后再交换通道，模型使用 BGR 顺序的输入
+        return cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
+
+
+def forward(batch):
+    """
+    对预处理好的一批图片做一次前向计算
+    :param batch: 形如 (N, ROWS, COLS, CHANNELS) 的 uint8 数组
+    :return: 形如 (N, 类别数) 的预测概率
+    """
+    return get_model().predict(batch)
+
+
+def top_k(predictions, k=3):
+    """
+    对整个预测矩阵一次性取前 k 个类别
+    :param predictions: 形如 (N, 类别数) 的预测概率
+    :param k: 每张图片返回的类别数量
+    :return: (类别编号, 概率) ，都是形如 (N, k) 的数组，每一行按概率从大到小排列
+    """
+    predictions = np.asarray(predictions)
+    k = min(k, predictions.shape[1])
+    # argpartition 只保证前 k 个是最大的，再对这 k 个排序即可
+    indices = np.argpartition(-predictions, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(predictions, indices, axis=1), axis=1, kind='stable')
+    indices = np.take_along_axis(indices, order, axis=1)
+    return indices, np.take_along_axis(predictions, indices, axis=1)
+
+
+def warm_up(batch_sizes=None):
+    """
+    加载模型，并对每一种批次大小做一次预测，提前完成计算图的构建和内存分配
+    :param batch_sizes: 需要预热的批次大小，默认为 1 和微批处理的最大批次
+    """
+    batch_sizes = batch_sizes or sorted({1, getattr(settings, 'IDENTIFY_BATCH_MAX_SIZE', 16)})
+    get_model()
+    for batch_size in batch_sizes:
+        forward(np.zeros((batch_size, ROWS, COLS, CHANNELS), dtype=np.uint8))
+
+
+def predict_images(sources, k=3, timer=None):
+    """
+    对给定的若干张图片进行分类，耗时只与传入的图片数量有关
+    :param sources: 图片列表，每一项可以是路径、二进制数据或者文件对象
+    :param k: 每张图片返回的类别数量
+    :param timer: ``StageTimer`` ，记录 decode 、 preprocess 和 inference 阶段的耗时
+    :return: (类别编号, 概率) ，都是形如 (N, k) 的数组，每一行按概率从大到小排列
+    """
+    data = np.ndarray((len(sources), ROWS, COLS, CHANNELS), dtype=np.uint8)  # data-type 数组中元素的类型
+    for i, source in enumerate(sources):
+        data[i] = read_image(source, timer)
 
     # 模型预测,输入测试集,输出预测结果  输出预测概率
-    predictions = model.predict(test / 127.5 - 1)
-    length = len(predictions)
-    for i in range(length):
-        result = []
-        for j in range(3):
-            pos = np.argmax(predictions[i])
-            result.append(pos)
-            predictions[i][pos] = -1
-    return result
+    with stage(timer, 'inference'):
+        if getattr(settings, 'IDENTIFY_BATCHING', True):
+            # 与同时到达的其他请求合并成一个批次进行预测
+            predictions = get_scheduler(forward).predict(data)
+        else:
+            predictions = forward(data)
+        return top_k(predictions, k)
+
+
+def predict_image(source, k=3, timer=None):
+    """对单张图片进行分类，返回前 k 个类别编号及其概率。"""
+    indices, probabilities = predict_images([source], k, timer)
+    return indices[0], probabilities[0]
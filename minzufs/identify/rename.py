@@ -1,40 +1,30 @@
 import time
-from .predict import *
-from PIL import Image
+
+from .metrics import stage
+from .predict import label, label2, predict_image
+from .storage import store_sorted_image
 
 
 class BatchRename:
-    def __init__(self):
-        self.path = './media/upload_images/'  # 表示需要命名处理的文件夹
+    def __init__(self, path, pk, content_hash=None):
+        self.path = path  # 需要识别并归类的图片（已经保存的上传文件）
+        self.pk = pk  # 识别记录的主键，用于生成不重复的文件名
+        self.content_hash = content_hash
 
-    def rename(self):
-        file_list = os.listdir(self.path)  # 获取文件路径
+    def rename(self, cached=None, timer=None):
+        """
+        识别图片并归类保存
+        :param cached: 已经缓存的识别结果 (类别编号, 概率) ，有缓存时跳过识别
+        :param timer: ``StageTimer`` ，记录各阶段的耗时
+        """
         old_time = time.time()
-        result = predict()
-        for item in file_list:
-            portion = list(os.path.splitext(item))  # os.path.splitext分离文件与扩展名
-            if portion[1] == '.jpg' or '.png' or '.jpeg' or '.tiff' or '.raw' or '.bmp':
-                src = os.path.join(os.path.realpath(self.path), item)
-                for j in range(14):
-                    if label[result[0]] == label[j]:
-                        save_path = './media/upload_sort' + '/save_' + label2[j]
-                        if not os.path.exists(os.path.realpath(save_path)):  # 若没有文件夹建造文件夹
-                            os.makedirs(os.path.realpath(save_path))
-                        file_list_save_num = len(os.listdir(save_path))  # 获取文件长度（个数）
-                        if file_list_save_num == 0:
-                            i = 0  # 表示文件的命名是从1开始的
-                        else:
-                            i = file_list_save_num
-                        dst = os.path.join(os.path.realpath(save_path),
-                                           label2[j]+'_' + str(i) + portion[1])
-            os.rename(src, dst)
-            # 裁剪图片大小
-            im = Image.open(dst)
-            # 重新设定大小
-            region = im.resize((400, 400))
-            region.save(dst)
-            i = i + 1
-            new_time = time.time()
-            time_consuming = round(new_time - old_time, 2)
+        self.result = cached if cached is not None else predict_image(self.path, timer=timer)
+        result, probabilities = self.result
+        with stage(timer, 'storage'):
+            dst = store_sorted_image(self.path, label2[result[0]], self.pk, self.content_hash)
+        new_time = time.time()
+        time_consuming = round(new_time - old_time, 2)
 
-        return label[result[0]], label[result[1]], label[result[2]], dst, time_consuming
+        nations = [label[i] for i in result]
+        confidences = [float(p) for p in probabilities]
+        return nations, confidences, str(dst), time_consuming
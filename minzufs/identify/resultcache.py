@@ -0,0 +1,73 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+from .predict import label
+
+# 民族名称到类别编号的映射，用于从数据库中的识别结果还原类别编号
+_label_index = {name: index for index, name in label.items()}
+
+
+class ResultCache:
+    """
+    以图片内容的哈希为键的识别结果缓存。
+
+    先查进程内有上限的 LRU 缓存，未命中时再查数据库中相同内容、相同模型版本的识别记录。
+    模型版本变化后，旧版本的结果都不会再被使用。
+    """
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self._version = None
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _check_version(self, version):
+        if version != self._version:
+            self._items.clear()
+            self._version = version
+
+    def get(self, content_hash, version):
+        with self._lock:
+            self._check_version(version)
+            result = self._items.get(content_hash)
+            if result is not None:
+                self._items.move_to_end(content_hash)
+            return result
+
+    def set(self, content_hash, version, result):
+        with self._lock:
+            self._check_version(version)
+            self._items[content_hash] = result
+            self._items.move_to_end(content_hash)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def lookup(self, content_hash, version, exclude_pk=None):
+        """
+        查找缓存的识别结果
+        :return: (类别编号, 概率) ，没有找到时返回 None
+        """
+        if not content_hash or not version:
+            return None
+        result = self.get(content_hash, version)
+        if result is not None:
+            return result
+        from .models import ImagesPost
+
+        post = ImagesPost.objects.filter(
+            content_hash=content_hash, model_version=version, status=ImagesPost.STATUS_DONE,
+            nation1__isnull=False, confidence1__isnull=False,
+        ).exclude(pk=exclude_pk).order_by('-id').first()
+        if post is None:
+            return None
+        nations = [post.nation1, post.nation2, post.nation3]
+        result = (np.array([_label_index[n] for n in nations]),
+                  np.array([post.confidence1, post.confidence2, post.confidence3]))
+        self.set(content_hash, version, result)
+        return result
+
+
+result_cache = ResultCache(getattr(settings, 'IDENTIFY_RESULT_CACHE_SIZE', 1024))
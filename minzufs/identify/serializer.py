@@ -10,16 +10,28 @@ class ImagesPostLogSerializerV2(serializers.ModelSerializer):
     nation1 = serializers.CharField(read_only=True)
     nation2 = serializers.CharField(read_only=True)
     nation3 = serializers.CharField(read_only=True)
+    confidence1 = serializers.FloatField(read_only=True)
+    confidence2 = serializers.FloatField(read_only=True)
+    confidence3 = serializers.FloatField(read_only=True)
     modified_nation = serializers.CharField(read_only=True)
     upload_images = serializers.ImageField()
     time_consuming = serializers.CharField(read_only=True)
+    status = serializers.CharField(read_only=True)
+    decode_seconds = serializers.FloatField(read_only=True)
+    preprocess_seconds = serializers.FloatField(read_only=True)
+    inference_seconds = serializers.FloatField(read_only=True)
+    storage_seconds = serializers.FloatField(read_only=True)
+    db_seconds = serializers.FloatField(read_only=True)
+    error_message = serializers.CharField(read_only=True)
     created = serializers.DateTimeField(read_only=True)
     modified = serializers.DateTimeField(read_only=True)
 
     class Meta:
         model = ImagesPost
-        fields = ["id", "user", "upload_images", "nation1", "nation2", "nation3", 'modified_nation', "time_consuming",
-                  "created", 'modified']
+        fields = ["id", "user", "upload_images", "nation1", "nation2", "nation3",
+                  "confidence1", "confidence2", "confidence3", 'modified_nation', "time_consuming",
+                  "status", "error_message", "decode_seconds", "preprocess_seconds", "inference_seconds",
+                  "storage_seconds", "db_seconds", "created", 'modified']
 
 
 _image_post_queryset = ImagesPost.objects.all()
@@ -36,14 +48,23 @@ class MergedImageSerializer(serializers.ModelSerializer):
     person_1_identification_detail = ImagesPostLogSerializerV2(source='person_1_identification', read_only=True)
     person_2_identification_detail = ImagesPostLogSerializerV2(source='person_2_identification', read_only=True)
     result_image = serializers.ImageField(read_only=True)
+    status = serializers.CharField(read_only=True)
+    error_message = serializers.CharField(read_only=True)
+    face_detection_seconds = serializers.FloatField(read_only=True)
+    face_swap_seconds = serializers.FloatField(read_only=True)
+    segmentation_seconds = serializers.FloatField(read_only=True)
+    blending_seconds = serializers.FloatField(read_only=True)
+    encoding_seconds = serializers.FloatField(read_only=True)
     detail_url = serializers.HyperlinkedIdentityField(view_name='merged-images-detail')
 
     class Meta:
         model = MergedImageModel
-        fields = ['id', 'user', 'detail_url', 'background_name', 'result_image',
+        fields = ['id', 'user', 'detail_url', 'background_name', 'result_image', 'status', 'error_message',
                   'person_1_head_image', 'person_2_head_image',
                   'person_1_identification', 'person_2_identification',
-                  'person_1_identification_detail', 'person_2_identification_detail', ]
+                  'person_1_identification_detail', 'person_2_identification_detail',
+                  'face_detection_seconds', 'face_swap_seconds', 'segmentation_seconds', 'blending_seconds',
+                  'encoding_seconds', ]
 
     def create(self, validated_data):
         request: Request = self.context.get('request')
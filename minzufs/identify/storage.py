@@ -0,0 +1,45 @@
+"""
+识别后图片的存储布局。
+
+图片按照类别保存在 ``upload_sort/save_<类别>/`` 下，再按照内容哈希的前四位分成两级子目录，
+文件名由记录的主键和内容哈希组成，不需要扫描目录计算序号，并发上传也不会出现重名。
+"""
+import hashlib
+import os
+import shutil
+from pathlib import Path
+
+from django.conf import settings
+
+SORTED_IMAGE_DIR = 'upload_sort'
+
+
+def sorted_image_name(label_code: str, pk, content_hash: str = None, ext: str = '.jpg') -> str:
+    """
+    归类后的图片相对于 ``MEDIA_ROOT`` 的路径
+    :param label_code: 类别的英文名，例如 ``miao``
+    :param pk: 识别记录的主键，批量导入时还没有主键，此时只使用内容哈希命名
+    :param content_hash: 图片内容的哈希，没有时使用主键的哈希分目录
+    :param ext: 文件扩展名
+    """
+    digest = content_hash or hashlib.sha256(str(pk).encode()).hexdigest()
+    file_name = f'{label_code}_{pk}-{digest[:12]}{ext.lower()}' if pk is not None else f'{label_code}_{digest[:16]}{ext.lower()}'
+    return os.path.join(SORTED_IMAGE_DIR, f'save_{label_code}', digest[:2], digest[2:4], file_name)
+
+
+def store_sorted_image(src, label_code: str, pk, content_hash: str = None, copy=False) -> Path:
+    """
+    把上传的图片移动到归类后的位置
+    :param src: 上传后保存的图片路径
+    :param copy: 复制而不是移动，用于批量导入时保留原始文件
+    :return: 移动后的绝对路径
+    """
+    name = sorted_image_name(label_code, pk, content_hash, os.path.splitext(str(src))[1])
+    dst = Path(settings.MEDIA_ROOT) / name
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    if copy:
+        shutil.copyfile(src, dst)
+    else:
+        # 同一个文件系统内是原子的重命名，不复制文件内容
+        os.replace(src, dst)
+    return dst
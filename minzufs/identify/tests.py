@@ -1,3 +1,298 @@
-from django.test import TestCase
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from PIL import Image
+
+from django.conf import settings
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from .batching import MicroBatchScheduler
+from .models import ImagesPost
+
+# 这些库只应该在第一次识别、合成时加载
+HEAVY_MODULES = ('tensorflow', 'keras', 'paddlehub', 'paddle', 'matplotlib', 'cv2', 'onnxruntime', 'tflite_runtime')
+
+_IMPORT_SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+import django
+django.setup()
+import minzufs.urls
+elapsed = time.perf_counter() - start
+print(json.dumps({"elapsed": elapsed, "modules": sorted(m for m in sys.modules if "." not in m)}))
+'''
+
+
+class ImportTimeTest(SimpleTestCase):
+    """``django.setup()`` 和加载路由时不应该导入机器学习相关的库。"""
+
+    # 导入时间的上限（秒），可以通过环境变量调整
+    budget = float(os.environ.get('IDENTIFY_IMPORT_BUDGET', 3.0))
+
+    def _import(self):
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'minzufs.settings'}
+        output = subprocess.check_output([sys.executable, '-c', _IMPORT_SCRIPT], cwd=settings.BASE_DIR, env=env)
+        return json.loads(output.decode().strip().splitlines()[-1])
+
+    def test_heavy_modules_are_not_imported(self):
+        modules = set(self._import()['modules'])
+        self.assertEqual([m for m in HEAVY_MODULES if m in modules], [])
+
+    def test_import_time_budget(self):
+        elapsed = self._import()['elapsed']
+        self.assertLess(elapsed, self.budget, f'django.setup() and URL loading took {elapsed:.2f}s')
+
+
+class MicroBatchSchedulerTest(SimpleTestCase):
+    """微批处理调度器：批次的大小、错误的传递和已取消的请求。"""
+
+    def setUp(self):
+        self.batches = []
+
+    def _predict(self, batch):
+        self.batches.append(len(batch))
+        return batch * 2
+
+    def test_batch_is_limited_by_max_batch_size(self):
+        scheduler = MicroBatchScheduler(self._predict, max_batch_size=4, max_wait=0.5)
+        result = scheduler.predict(np.arange(5).reshape(5, 1), timeout=5)
+        self.assertEqual(result.ravel().tolist(), [0, 2, 4, 6, 8])
+        self.assertEqual(self.batches, [4, 1])
+
+    def test_batch_is_closed_after_max_wait(self):
+        scheduler = MicroBatchScheduler(self._predict, max_batch_size=16, max_wait=0.05)
+        start = time.monotonic()
+        first = scheduler.submit(np.array([1]))
+        self.assertEqual(first.result(timeout=5).tolist(), [2])
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(scheduler.submit(np.array([2])).result(timeout=5).tolist(), [4])
+        self.assertEqual(self.batches, [1, 1])
+
+    def test_error_reaches_every_caller(self):
+        def fail(batch):
+            raise RuntimeError('backend failed')
+
+        scheduler = MicroBatchScheduler(fail, max_batch_size=4, max_wait=0.5)
+        futures = scheduler.submit_many([np.array([i]) for i in range(3)])
+        for future in futures:
+            with self.assertRaisesMessage(RuntimeError, 'backend failed'):
+                future.result(timeout=5)
+
+    def test_wrong_row_count_fails_callers_and_keeps_worker(self):
+        outputs = [np.zeros((1, 1)), None]
+
+        def predict(batch):
+            output = outputs.pop(0)
+            return batch if output is None else output
+
+        scheduler = MicroBatchScheduler(predict, max_batch_size=4, max_wait=0.5)
+        futures = scheduler.submit_many([np.array([i]) for i in range(3)])
+        for future in futures:
+            with self.assertRaises(ValueError):
+                future.result(timeout=5)
+        self.assertEqual(scheduler.predict([np.array([7])], timeout=5).tolist(), [[7]])
+
+    def test_cancelled_futures_are_skipped(self):
+        release = threading.Event()
+
+        def predict(batch):
+            release.wait(5)
+            return self._predict(batch)
+
+        scheduler = MicroBatchScheduler(predict, max_batch_size=4, max_wait=0)
+        blocking = scheduler.submit(np.array([0]))
+        time.sleep(0.05)  # 第一个批次已经开始计算
+        cancelled, kept = scheduler.submit(np.array([1])), scheduler.submit(np.array([2]))
+        self.assertTrue(cancelled.cancel())
+        release.set()
+        self.assertEqual(blocking.result(timeout=5).tolist(), [0])
+        self.assertEqual(kept.result(timeout=5).tolist(), [4])
+        self.assertEqual(self.batches, [1, 1])
+
+
+class _FakeModel:
+    """代替分类模型，固定返回第 ``index`` 个类别，或者抛出异常。"""
+
+    def __init__(self, index=0, error=None):
+        self.index, self.error = index, error
+
+    def predict(self, batch):
+        if self.error:
+            raise self.error
+        predictions = np.full((len(batch), 15), 0.01)
+        predictions[:, self.index] = 0.86
+        return predictions
+
+
+@override_settings(IDENTIFY_BATCHING=False, IDENTIFY_MODEL_VERSION=None)
+class AsyncIdentifyTest(TransactionTestCase):
+    """异步识别：上传后立即返回等待中的记录，轮询 status 接口直到识别完成或失败。"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+
+    def _upload(self, color):
+        buffer = io.BytesIO()
+        Image.new('RGB', (64, 48), color).save(buffer, 'JPEG')
+        buffer.seek(0)
+        buffer.name = 'upload.jpg'
+        response = self.client.post('/api/images/?async=1', {'upload_images': buffer})
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['status'], ImagesPost.STATUS_PENDING)
+        return response.json()['id']
+
+    def _poll(self, pk, timeout=10):
+        deadline = time.monotonic() + timeout
+        while True:
+            data = self.client.get(f'/api/images/{pk}/status/').json()
+            if data['status'] in (ImagesPost.STATUS_DONE, ImagesPost.STATUS_FAILED) or time.monotonic() > deadline:
+                return data
+            time.sleep(0.05)
+
+    def test_async_identify_done(self):
+        with mock.patch('identify.predict.get_model', return_value=_FakeModel(index=5)):
+            data = self._poll(self._upload((200, 30, 30)))
+        self.assertEqual(data['status'], ImagesPost.STATUS_DONE, data)
+        self.assertEqual(data['nation1'], '藏族')
+        self.assertAlmostEqual(data['confidence1'], 0.86)
+        self.assertIsNone(data['error_message'])
+
+    def test_async_identify_failed_and_retry(self):
+        with mock.patch('identify.predict.get_model', return_value=_FakeModel(error=RuntimeError('model failed'))):
+            pk = self._upload((30, 200, 30))
+            data = self._poll(pk)
+        self.assertEqual(data['status'], ImagesPost.STATUS_FAILED, data)
+        self.assertEqual(data['error_message'], 'model failed')
+
+        with mock.patch('identify.predict.get_model', return_value=_FakeModel(index=1)):
+            self.client.get(f'/api/images/{pk}/status/?retry=1')
+            data = self._poll(pk)
+        self.assertEqual(data['status'], ImagesPost.STATUS_DONE, data)
+        self.assertEqual(data['nation1'], '彝族')
+
+    def test_stale_job_is_reported_failed(self):
+        with mock.patch('identify.jobs.submit_identify'):
+            pk = self._upload((30, 30, 200))
+        ImagesPost.objects.filter(pk=pk).update(status_changed=timezone.now() - timedelta(hours=1))
+        data = self.client.get(f'/api/images/{pk}/status/').json()
+        self.assertEqual(data['status'], ImagesPost.STATUS_FAILED)
+        self.assertTrue(data['error_message'])
+
+
+class OpenCVFaceSwapTest(SimpleTestCase):
+    """本地换脸后端的对齐和融合，使用合成的图片，不需要人脸检测模型。"""
+
+    def setUp(self):
+        from .lib.facebackends import OpenCVFaceBackend
+
+        # 跳过 __init__ ，不加载人脸检测器
+        self.backend = OpenCVFaceBackend.__new__(OpenCVFaceBackend)
+
+    @staticmethod
+    def _face(top, left, size, landmarks=None):
+        face = {'top': top, 'left': left, 'width': size, 'height': size}
+        if landmarks is not None:
+            face['landmarks'] = landmarks
+        return face
+
+    def test_transform_from_landmarks(self):
+        src = np.float32([[30, 40], [70, 40], [50, 60], [35, 80], [65, 80]])
+        angle, scale, shift = np.deg2rad(10), 1.5, np.float32([12, -7])
+        rotation = scale * np.float32([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+        dst = src @ rotation.T + shift
+        matrix = self.backend._transform(self._face(0, 0, 10, dst.tolist()), self._face(0, 0, 10, src.tolist()))
+        np.testing.assert_allclose(matrix[:, :2], rotation, atol=1e-3)
+        np.testing.assert_allclose(matrix[:, 2], shift, atol=1e-2)
+
+    def test_transform_from_boxes(self):
+        matrix = self.backend._transform(self._face(100, 50, 80), self._face(10, 20, 40))
+        # 提取图片的人脸中心 (40, 30) 映射到模板的人脸中心 (90, 140) ，并放大两倍
+        center = matrix @ np.float32([40, 30, 1])
+        np.testing.assert_allclose(center, [90, 140])
+        np.testing.assert_allclose(matrix[:, :2], [[2, 0], [0, 2]])
+
+    def test_swap_changes_only_the_face(self):
+        from .lib.facebackends import FaceImage
+
+        template = np.full((200, 160, 3), (40, 80, 120), np.uint8)
+        # 泊松融合保留的是提取图片的梯度，使用条纹而不是纯色
+        extract = np.zeros((100, 100, 3), np.uint8)
+        extract[::8] = 200
+        template_face, extract_face = self._face(60, 40, 80), self._face(20, 20, 60)
+        result = self.backend.swap(FaceImage(array=template), template_face, FaceImage(array=extract), extract_face, 100)
+        self.assertEqual(result.shape, template.shape)
+        # 人脸区域出现了提取图片的条纹，远离人脸的区域保持不变
+        self.assertGreater(result[80:120, 60:100].std(), 10)
+        np.testing.assert_array_equal(result[:20], template[:20])
+        np.testing.assert_array_equal(result[-20:], template[-20:])
+
+    def test_swap_rate_zero_keeps_template(self):
+        from .lib.facebackends import FaceImage
+
+        template = np.full((120, 120, 3), 90, np.uint8)
+        extract = np.full((60, 60, 3), 250, np.uint8)
+        result = self.backend.swap(FaceImage(array=template), self._face(30, 30, 60),
+                                   FaceImage(array=extract), self._face(0, 0, 60), 0)
+        self.assertLessEqual(np.abs(result.astype(int) - template).max(), 2)
+
+    def test_face_outside_template_is_rejected(self):
+        from .lib.facebackends import FaceImage
+
+        with self.assertRaises(ValueError):
+            self.backend.swap(FaceImage(array=np.zeros((50, 50, 3), np.uint8)), self._face(500, 500, 40),
+                              FaceImage(array=np.zeros((50, 50, 3), np.uint8)), self._face(0, 0, 40), 100)
+
+
+class TopKTest(SimpleTestCase):
+    """``predict.top_k`` 与对整行做 argsort 的结果一致。"""
+
+    def test_matches_argsort(self):
+        from .predict import top_k
+
+        predictions = np.random.default_rng(0).random((64, 15)).astype(np.float32)
+        for k in (1, 3, 15, 20):
+            indices, probabilities = top_k(predictions, k)
+            expected = np.argsort(-predictions, axis=1)[:, :min(k, 15)]
+            np.testing.assert_array_equal(indices, expected)
+            np.testing.assert_array_equal(probabilities, np.take_along_axis(predictions, expected, axis=1))
+
+    def test_ties_keep_the_top_probabilities(self):
+        from .predict import top_k
+
+        predictions = np.array([[0.2, 0.3, 0.3, 0.1, 0.3], [0.25, 0.25, 0.25, 0.25, 0.0]])
+        indices, probabilities = top_k(predictions, 3)
+        np.testing.assert_array_equal(probabilities, [[0.3, 0.3, 0.3], [0.25, 0.25, 0.25]])
+        self.assertEqual([sorted(row) for row in indices.tolist()], [[1, 2, 4], [0, 1, 2]])
+
+
+class CompositeTest(SimpleTestCase):
+    """``mergeimages.composite`` 的定点数混合与浮点数计算后四舍五入的结果完全一致。"""
+
+    def test_matches_float_rounding(self):
+        from .lib.mergeimages import composite
+
+        # 每个像素是一组 (前景, 透明度) ，覆盖全部 256 x 256 种组合；三个通道使用不同的背景
+        value, alpha = np.meshgrid(np.arange(256), np.arange(256), indexing='ij')
+        fg = np.dstack([value, 255 - value, value, alpha]).astype(np.uint8)
+        rng = np.random.default_rng(0)
+        bg = np.dstack([np.zeros_like(value), np.full_like(value, 255), rng.integers(0, 256, value.shape)])
+        roi = bg.astype(np.uint8)
+        composite(fg, roi)
+        a = fg[:, :, 3:].astype(np.float64)
+        expected = np.rint((fg[:, :, :3] * a + bg * (255 - a)) / 255)
+        np.testing.assert_array_equal(roi, expected)
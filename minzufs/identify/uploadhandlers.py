@@ -0,0 +1,53 @@
+"""
+上传文件的同时计算内容的 SHA-256 ，避免保存之后再把文件完整读一遍。
+
+计算结果保存在上传文件对象的 ``sha256`` 属性上。
+"""
+import hashlib
+
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+
+
+class _HashingMixin:
+    def new_file(self, *args, **kwargs):
+        self._sha256 = hashlib.sha256()
+        return super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        result = super().receive_data_chunk(raw_data, start)
+        # 返回 None 说明由当前处理器接收了这段数据，只在接收数据的处理器里计算一次
+        if result is None:
+            self._sha256.update(raw_data)
+        return result
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.sha256 = self._sha256.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(_HashingMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(_HashingMixin, TemporaryFileUploadHandler):
+    pass
+
+
+def file_sha256(file) -> str:
+    """
+    获取文件内容的 SHA-256
+    :param file: 上传文件或者 ``FieldFile`` ，上传时已经计算过的直接返回
+    """
+    digest = getattr(file, 'sha256', None)
+    if digest:
+        return digest
+    sha256 = hashlib.sha256()
+    file.open('rb')
+    try:
+        for chunk in file.chunks():
+            sha256.update(chunk)
+    finally:
+        file.seek(0)
+    return sha256.hexdigest()
@@ -0,0 +1,14 @@
+from django.http import HttpResponse, JsonResponse
+
+from .health import readiness
+from .metrics import registry
+
+
+def health_ready(request):
+    """就绪检查，预热完成之前返回 503 。"""
+    return JsonResponse(readiness.as_dict(), status=200 if readiness.is_ready else 503)
+
+
+def metrics(request):
+    """各阶段耗时的直方图，Prometheus 文本格式。"""
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
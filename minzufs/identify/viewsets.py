@@ -1,10 +1,11 @@
-import os
 from pathlib import Path
 
 import rest_framework.pagination
 from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
 from django.shortcuts import redirect
+from django.utils import timezone
 from django.utils.datastructures import MultiValueDictKeyError
 from rest_framework import mixins, exceptions
 from rest_framework import viewsets
@@ -15,11 +16,33 @@ from rest_framework.request import Request
 from rest_framework.response import Response
 
 from users.models import UserProfile
+from . import jobs, lib
+from .derivatives import DERIVATIVE_SIZES, get_derivative_url
 from .models import ImagesPost, MergedImageModel
-from .rename import BatchRename
 from .serializer import ImagesPostLogSerializerV2, MergedImageSerializer
 
 
+def _query_flag(request: Request, name, default=False) -> bool:
+    """布尔类型的请求参数， ``1`` 、 ``true`` 、 ``yes`` 为真，没有这个参数时返回 ``default`` 。"""
+    value = request.query_params.get(name)
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def _derivative_redirect(request: Request, field_file):
+    """跳转到图片的某个衍生尺寸，尺寸通过请求参数 ``size`` 指定，默认为 ``list`` 。"""
+    size = request.query_params.get('size', 'list')
+    if size not in DERIVATIVE_SIZES:
+        raise exceptions.ValidationError(f'参数size只能是{"、".join(DERIVATIVE_SIZES)}之一')
+    if not field_file:
+        raise exceptions.NotFound('图片不存在')
+    try:
+        return redirect(get_derivative_url(field_file, size))
+    except FileNotFoundError:
+        raise exceptions.NotFound('图片不存在')
+
+
 class ImagesPostViewSet(mixins.ListModelMixin, mixins.CreateModelMixin, mixins.DestroyModelMixin,
                         mixins.RetrieveModelMixin,
                         viewsets.GenericViewSet):
@@ -46,21 +69,51 @@ class ImagesPostViewSet(mixins.ListModelMixin, mixins.CreateModelMixin, mixins.D
         """
         创建一张照片，并进行识别
         """
-        super(ImagesPostViewSet, self).perform_create(serializer)
+        upload = serializer.validated_data['upload_images']
+        # 上传时已经计算好的内容哈希，用于复用相同图片的识别结果；识别完成之前状态为等待识别
+        serializer.save(content_hash=getattr(upload, 'sha256', None), status=ImagesPost.STATUS_PENDING,
+                        status_changed=timezone.now())
         instance: ImagesPost = serializer.instance
         instance.user = None if isinstance(self.request.user, AnonymousUser) else self.request.user
-        # 实例化重命名BatchRename()模块  运行predict.py与rename.py
-        batch_rename = BatchRename()
-        # 提取相应的返回值
-        nation1, nation2, nation3, dst, time_consuming = batch_rename.rename()
-        # dst：图片重新分类后保存的路径  new_url 截取的相对路径
-        instance.upload_images = os.path.relpath(dst, settings.MEDIA_ROOT)
-        # 类别
-        instance.nation1 = nation1
-        instance.nation2 = nation2
-        instance.nation3 = nation3
-        instance.time_consuming = time_consuming  # 耗费的时间
         instance.save()
+        if self._is_async():
+            # 异步识别：直接返回等待中的对象，由后台线程池完成识别，前端轮询 status 接口
+            jobs.submit_identify(instance.id)
+            return
+        instance.identify()
+
+    def _is_async(self) -> bool:
+        """请求参数 ``async`` 优先，否则使用 ``settings.IDENTIFY_ASYNC`` 。"""
+        return _query_flag(self.request, 'async', getattr(settings, 'IDENTIFY_ASYNC', False))
+
+    @action(detail=True, url_path='status', url_name='status', methods=['GET'])
+    def status(self, request: Request, pk: str):
+        """
+        查询识别状态，识别完成后同时返回识别结果。
+        长时间停在等待识别或正在识别的任务已经丢失，记为识别失败；
+        请求参数 ``retry=1`` 时把识别失败的图片重新放入后台识别。
+        """
+        instance: ImagesPost = self.get_object()
+        instance.fail_if_stale()
+        if _query_flag(request, 'retry') and instance.requeue():
+            jobs.submit_identify(instance.id)
+        return Response({
+            'id': instance.id,
+            'status': instance.status,
+            'error_message': instance.error_message,
+            'nation1': instance.nation1,
+            'nation2': instance.nation2,
+            'nation3': instance.nation3,
+            'confidence1': instance.confidence1,
+            'confidence2': instance.confidence2,
+            'confidence3': instance.confidence3,
+        })
+
+    @action(detail=True, url_path='derivative', url_name='derivative', methods=['GET'])
+    def derivative(self, request: Request, pk: str):
+        """上传图片的缩略图等尺寸，第一次访问时生成。"""
+        instance: ImagesPost = self.get_object()
+        return _derivative_redirect(request, instance.upload_images)
 
     # 修改民族类别 @action 额外的路由方法（drf视图集）
     @action(detail=True, url_path='change-nation', url_name='change-nation', methods=['GET'])
@@ -131,10 +184,50 @@ class MergedImageViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, url_name='merge', url_path='merge')
     def merge(self, request: Request, pk):
+        """
+        执行图像合成后跳转到详情。
+        请求参数 ``async=1`` （或 ``settings.IDENTIFY_MERGE_ASYNC`` ）时放入后台线程池执行，立即跳转到详情，
+        前端轮询详情中的 ``status`` 直到 ``done`` 或 ``failed`` 。
+        """
         obj: MergedImageModel = self.get_object()
-        obj.merge()
+        if _query_flag(request, 'async', getattr(settings, 'IDENTIFY_MERGE_ASYNC', False)):
+            if obj.queue():
+                jobs.submit_merge(obj.id)
+        else:
+            obj.merge()
         return redirect('merged-images-detail', obj.id)
 
+    @action(detail=True, url_name='render-all', url_path='render-all')
+    def render_all(self, request: Request, pk):
+        """
+        把同一对人像合成到多个背景上，换脸和分割只做一次，各个背景并行混合。
+        请求参数 ``backgrounds=bg1,bg3`` 指定背景，默认全部背景；
+        ``sheet=1`` 时直接返回所有背景排列成的一张 PNG 预览图，否则保存每个背景的结果并返回访问地址。
+        """
+        obj: MergedImageModel = self.get_object()
+        background_names = [name for name in request.query_params.get('backgrounds', '').split(',') if name]
+        unknown = [name for name in background_names if name not in lib.backgrounds.BACKGROUND_LIST]
+        if unknown:
+            raise exceptions.ValidationError(f'背景{"、".join(unknown)}不存在')
+        try:
+            if _query_flag(request, 'sheet'):
+                return HttpResponse(obj.render_contact_sheet(background_names), content_type='image/png')
+            names = obj.render_all(background_names)
+        except ValueError as e:
+            raise exceptions.ValidationError(str(e))
+        storage = obj.result_image.storage
+        return Response({
+            'id': obj.id,
+            'results': [{'background_name': background, 'url': request.build_absolute_uri(storage.url(name))}
+                        for background, name in names.items()],
+        })
+
+    @action(detail=True, url_name='derivative', url_path='derivative')
+    def derivative(self, request: Request, pk):
+        """合成图片的缩略图等尺寸，第一次访问时生成。"""
+        obj: MergedImageModel = self.get_object()
+        return _derivative_redirect(request, obj.result_image)
+
     @action(detail=False, url_name='travelled', url_path='travelled')
     def travelled(self, request: Request):
         qs = self.get_queryset().exclude(result_image__exact=None).order_by('-id')
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'minzufs.settings')
 
 application = get_asgi_application()
+
+# 只在服务进程中预热模型，管理命令不会加载
+from identify.health import start_server_warm_up  # noqa: E402
+
+start_server_warm_up()
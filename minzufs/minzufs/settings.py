@@ -285,3 +285,72 @@ LOGGING = {
         },
     },
 }
+
+# 服饰识别的推理配置
+# 是否把同时到达的识别请求合并成一个批次进行预测
+IDENTIFY_BATCHING = True
+# 一个批次最多包含的图片数量
+IDENTIFY_BATCH_MAX_SIZE = 16
+# 第一张图片到达后最多等待的时间（秒）
+IDENTIFY_BATCH_MAX_WAIT = 0.01
+# 上传图片后是否默认异步识别（请求参数 async 可以覆盖）
+IDENTIFY_ASYNC = False
+# 后台任务线程池的线程数量
+IDENTIFY_JOB_WORKERS = 2
+# 识别状态超过这个秒数没有更新时视为任务已经丢失（例如进程重启），查询状态时记为识别失败
+IDENTIFY_JOB_STALE_SECONDS = 600
+# 识别结果缓存的最大条数
+IDENTIFY_RESULT_CACHE_SIZE = 1024
+# 模型版本，为空时根据模型文件自动生成；版本变化后缓存的识别结果失效
+IDENTIFY_MODEL_VERSION = None
+
+# 上传文件时同时计算内容的哈希
+FILE_UPLOAD_HANDLERS = [
+    'identify.uploadhandlers.HashingMemoryFileUploadHandler',
+    'identify.uploadhandlers.HashingTemporaryFileUploadHandler',
+]
+# 缩略图等衍生图片缓存的最大总大小（字节）
+IDENTIFY_DERIVATIVE_CACHE_BYTES = 512 * 1024 * 1024
+# 服务进程（ wsgi / asgi ）启动后是否在后台加载模型并预热，开启后 /api/health/ready 在预热完成后才返回就绪；管理命令不会预热
+IDENTIFY_WARMUP = False
+# 需要预热的批次大小，为空时使用 1 和 IDENTIFY_BATCH_MAX_SIZE
+IDENTIFY_WARMUP_BATCH_SIZES = None
+# 推理后端：keras 、 onnx 或 tflite ，后两者需要先用 export_model 命令导出模型
+IDENTIFY_INFERENCE_BACKEND = 'keras'
+# 合成背景解码后是否保存为 .npy 并以内存映射方式打开，多个 worker 进程共享同一份像素
+IDENTIFY_BACKGROUND_MMAP = False
+# 图像合成是否默认在后台执行（请求参数 async 可以覆盖）
+IDENTIFY_MERGE_ASYNC = False
+# 图像合成线程池的线程数量
+IDENTIFY_MERGE_WORKERS = 2
+# 合成状态超过这个秒数没有更新时视为任务已经丢失（例如进程重启），可以重新排队
+IDENTIFY_MERGE_STALE_SECONDS = 600
+# 合成中计算密集阶段的并发上限
+IDENTIFY_MERGE_STAGE_LIMITS = {
+    'segmentation': 1,
+    'blending': 2,
+}
+# 换脸后端： facepp 调用 Face++ 云端接口， opencv 在本地运行
+IDENTIFY_FACE_BACKEND = 'facepp'
+# opencv 后端使用的 YuNet 人脸检测模型（ face_detection_yunet_*.onnx ），不存在时使用 Haar 级联分类器
+# 模型不随代码提供，需要从 opencv_zoo 下载到 trained_model 目录：
+#   wget -P trained_model https://github.com/opencv/opencv_zoo/raw/main/models/face_detection_yunet/face_detection_yunet_2023mar.onnx
+# OpenCV 5 没有 Haar 级联分类器，此时必须下载 YuNet 模型
+IDENTIFY_YUNET_MODEL = os.path.join(BASE_DIR, 'trained_model', 'face_detection_yunet_2023mar.onnx')
+IDENTIFY_HAAR_CASCADE = None
+# Face++ 的接口地址和访问密钥，离线压测时可以指向 manage.py facepp_mock_server 启动的本地服务
+FACEPP_API_BASE = 'https://api-cn.faceplusplus.com'
+FACEPP_API_KEY = 'x2NyKaa6vYuArYwat4x0-NpIbM9CrwGU'
+FACEPP_API_SECRET = 'OuHx-Xaey1QrORwdG7QetGG5JhOIC8g7'
+# Face++ 请求的（连接，读取）超时秒数、失败后的重试次数以及连接池大小
+FACEPP_TIMEOUT = (3.05, 20)
+FACEPP_RETRIES = 2
+FACEPP_POOL_SIZE = 8
+# 按图片内容缓存人脸检测结果，同一张图片再次合成时跳过检测；超过条目上限时删除最久没有使用的
+IDENTIFY_FACE_CACHE = True
+IDENTIFY_FACE_CACHE_MAX_ENTRIES = 10000
+# 缓存换脸并分割后的人像（ MEDIA_ROOT/merge-cutouts ），更换背景时只需要重新混合；超过大小上限时删除最久没有使用的
+IDENTIFY_CUTOUT_CACHE = True
+IDENTIFY_CUTOUT_CACHE_BYTES = 256 * 1024 * 1024
+# 一次合成到多个背景（ render-all ）时并行混合的线程数量
+IDENTIFY_RENDER_WORKERS = 4
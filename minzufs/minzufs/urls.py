@@ -11,6 +11,7 @@ from rest_framework_simplejwt.views import (
     TokenRefreshView,
 )
 
+from identify.views import health_ready, metrics
 from identify.viewsets import ImagesPostViewSet, MergedImageViewSet
 from users.viewsets import UserViewSet
 
@@ -29,6 +30,8 @@ urlpatterns = [
     path('api-auth/', include('rest_framework.urls')),
 
     path('api/token/obtain/', obtain_jwt_token),
+    path('api/health/ready', health_ready, name='health-ready'),
+    path('api/metrics', metrics, name='metrics'),
     path('api/', include(router.urls)),
 
     path('process/', RedirectToAPI.as_view()),